@@ -1,20 +1,28 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import sqlite3
-import json
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta, date
-import pandas as pd
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import random
+import bisect
+import functools
+import itertools
 import base64
 import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+import csv
+import tempfile
+import importlib
 import time
+import os
+import logging
+import atexit
+import queue
+import threading
+import uuid
+import types
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 
 st.set_page_config(
     page_title="MedTimer - Medication Management",
@@ -23,9 +31,282 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+logger = logging.getLogger('medtimer')
+
+DB_PATH = os.environ.get('MEDTIMER_DB_PATH', 'medtimer.db')
+DB_POOL_SIZE = 8
+
+# 'wal': WAL journal, tuned pragmas and a single background writer thread.
+# 'rollback': SQLite's default rollback journal with writes on the caller's thread.
+STORAGE_MODE = os.environ.get('MEDTIMER_STORAGE_MODE', 'wal')
+WRITE_BATCH_SIZE = 64
+
+# Plotting, dataframe and PDF libraries are imported on first use so cold starts
+# only pay for what the first page needs. MEDTIMER_PRELOAD_IMPORTS=1 still keeps
+# startup lazy but warms them on a background thread right after bootstrap.
+PRELOAD_IMPORTS = os.environ.get('MEDTIMER_PRELOAD_IMPORTS') == '1'
+HEAVY_MODULES = ('numpy', 'pandas', 'plotly.graph_objects', 'reportlab.platypus')
+
+# History stays in the database and is fetched per date window, page by page
+HISTORY_PAGE_SIZE = 500
+HISTORY_WINDOWS = {'Last 30 days': 30, 'Last 90 days': 90, 'Last year': 365}
+
+# Weekly heatmap: hours per time-of-day bucket, and the history size above which
+# binning is pushed down into a SQL GROUP BY instead of done in pandas
+HEATMAP_BUCKET_HOURS = 3
+HEATMAP_BUCKET_CHOICES = [1, 2, 3, 4, 6]
+HEATMAP_SQL_THRESHOLD = 5000
+
+# PDF reports are built on a worker pool; finished reports are kept by cache key
+REPORT_WORKERS = 2
+REPORT_CACHE_SIZE = 64
+
+# Text/CSV reports are written into a spooled file that moves to disk past this size
+REPORT_SPOOL_SIZE = 1024 * 1024
+REPORT_PREVIEW_LINES = 200
+
+# PDF tables are split into chunks of this many rows, each repeating the header, and the
+# story is generated lazily with at most REPORT_STORY_LOOKAHEAD flowables held at once
+REPORT_TABLE_ROWS = 100
+REPORT_STORY_LOOKAHEAD = 8
+
+# Built Plotly figures are reused across reruns until the session's data changes
+FIGURE_CACHE_SESSION_SIZE = 16
+FIGURE_CACHE_MAX_SIZE = 512
+
+def configure_connection(conn):
+    """Apply per-connection pragmas to a freshly opened SQLite connection"""
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -16000')
+    if STORAGE_MODE == 'wal':
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA mmap_size = 268435456')
+
+class ConnectionPool:
+    """Process-wide pool of long-lived SQLite connections.
+
+    Connections are opened lazily, configured once, and handed back to the
+    pool after use so their page cache and compiled statement cache survive
+    across requests instead of being rebuilt on every connect.
+    """
+    
+    def __init__(self, path=DB_PATH, size=DB_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._closed = False
+    
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        configure_connection(conn)
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+    
+    def close_all(self):
+        """Close every idle connection; connections still in use close on release"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@st.cache_resource
+def get_connection_pool():
+    """Get the connection pool shared by every session of this server process"""
+    pool = ConnectionPool(DB_PATH)
+    atexit.register(pool.close_all)
+    return pool
+
+# Per-thread pool set by using_connection_pool() for code running off the script thread
+_thread_pool = threading.local()
+
+def get_db_connection():
+    """Borrow a pooled database connection (use as a context manager)"""
+    pool = getattr(_thread_pool, 'pool', None) or get_connection_pool()
+    return pool.connection()
+
+@contextmanager
+def using_connection_pool(pool):
+    """Serve get_db_connection() on this thread from ``pool`` without looking up the cached one.
+
+    Cached resources log a warning for every lookup made outside the script
+    thread, so background jobs are handed the pool up front instead.
+    """
+    previous = getattr(_thread_pool, 'pool', None)
+    _thread_pool.pool = pool or previous
+    try:
+        yield
+    finally:
+        _thread_pool.pool = previous
+
+class DatabaseWriter:
+    """Background thread that serializes all writes through one connection.
+
+    Jobs are ``fn(conn, *args)`` callables. Whatever is queued when the
+    thread wakes up is committed in a single transaction, with a savepoint
+    per job so one failing job does not roll back its neighbours.
+    """
+    
+    def __init__(self, path=DB_PATH, batch_size=WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='medtimer-db-writer', daemon=True)
+        self._thread.start()
+    
+    def submit(self, fn, *args):
+        """Queue a write job and return a Future for its result"""
+        future = Future()
+        self._jobs.put((fn, args, future))
+        return future
+    
+    def close(self):
+        """Flush pending jobs and stop the writer thread"""
+        self._jobs.put(None)
+        self._thread.join()
+    
+    def _next_batch(self):
+        batch = [self._jobs.get()]
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self._jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        configure_connection(conn)
+        running = True
+        while running:
+            batch = self._next_batch()
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if batch:
+                self._commit_batch(conn, batch)
+        conn.close()
+    
+    def _commit_batch(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, future in batch:
+                conn.execute('SAVEPOINT job')
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO job')
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                conn.execute('RELEASE job')
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            outcomes = [(future, None, e) for _, _, future in batch]
+        
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+@st.cache_resource
+def get_database_writer():
+    """Get the writer thread shared by every session of this server process"""
+    writer = DatabaseWriter(DB_PATH)
+    atexit.register(writer.close)
+    return writer
+
+def run_write(fn, *args):
+    """Run ``fn(conn, *args)`` as a write transaction and return its result"""
+    if STORAGE_MODE == 'wal':
+        return get_database_writer().submit(fn, *args).result()
+    with get_db_connection() as conn, conn:
+        # sqlite3 opens no implicit transaction for statements such as WITH ... UPDATE,
+        # so begin one explicitly, as the writer thread does
+        conn.execute('BEGIN IMMEDIATE')
+        return fn(conn, *args)
+
 def init_database():
-    """Initialize SQLite database with all tables"""
-    conn = sqlite3.connect('medtimer.db', check_same_thread=False)
+    """Initialize SQLite database and apply any pending schema migrations"""
+    with get_db_connection() as conn:
+        return migrate_database(conn)
+
+@st.cache_resource
+def bootstrap_database():
+    """Run schema setup once per server process instead of on every rerun.
+
+    st.cache_resource holds a per-key lock while computing, so concurrent
+    first sessions wait for a single bootstrap rather than racing it.
+    """
+    start = time.perf_counter()
+    version = init_database()
+    bootstrap_ms = (time.perf_counter() - start) * 1000
+    logger.info("Database bootstrap took %.1f ms (schema version %s)", bootstrap_ms, version)
+    if PRELOAD_IMPORTS:
+        threading.Thread(target=preload_heavy_modules, name='medtimer-preload', daemon=True).start()
+    return {'schema_version': version, 'bootstrap_ms': bootstrap_ms}
+
+def preload_heavy_modules():
+    """Import the lazily imported libraries ahead of their first use"""
+    for name in HEAVY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        logger.info("Preloaded %s in %.1f ms", name, (time.perf_counter() - start) * 1000)
+
+def migrate_database(conn):
+    """Upgrade the schema in place to the latest version and return that version.
+
+    Pending migrations run in order inside one ``BEGIN IMMEDIATE`` transaction,
+    so concurrent processes cannot apply the same migration twice and a
+    failing migration leaves the database on its previous version.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     name TEXT,
+                     applied_at TEXT)''')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        current = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+        for version, name, apply_migration in MIGRATIONS:
+            if version <= current:
+                continue
+            apply_migration(conn)
+            conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                         (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            current = version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return current
+
+def migration_initial_schema(conn):
+    """Create the original application tables (no-op on pre-migration databases)"""
     c = conn.cursor()
     
     c.execute('''CREATE TABLE IF NOT EXISTS users
@@ -120,13 +401,149 @@ def init_database():
                   acknowledged INTEGER DEFAULT 0,
                   created_at TEXT,
                   FOREIGN KEY(username) REFERENCES users(username))''')
+
+def migration_lookup_indexes(conn):
+    """Index the per-user lookups and make adherence rows unique per user and day"""
+    c = conn.cursor()
     
-    conn.commit()
-    conn.close()
+    c.execute('CREATE INDEX IF NOT EXISTS idx_diseases_username ON diseases(username)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_medications_username ON medications(username)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_appointments_username_date ON appointments(username, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_side_effects_username_date ON side_effects(username, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_medication_history_username_date ON medication_history(username, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_reminders_username ON reminders(username)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_connected_patients_caregiver ON connected_patients(caregiver_username)')
+    
+    # Older databases can hold several rows for the same day; keep the latest one
+    c.execute('''DELETE FROM adherence_history
+                 WHERE id NOT IN (SELECT MAX(id) FROM adherence_history GROUP BY username, date)''')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_adherence_history_username_date ON adherence_history(username, date)')
 
-def get_db_connection():
-    """Get database connection"""
-    return sqlite3.connect('medtimer.db', check_same_thread=False)
+def migration_adherence_upsert_key(conn):
+    """Rebuild adherence_history with UNIQUE(username, date) and without AUTOINCREMENT.
+
+    With AUTOINCREMENT every ``INSERT ... ON CONFLICT DO UPDATE`` burns a
+    sequence number and rewrites sqlite_sequence even when it only updates.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TABLE adherence_history_new
+                 (id INTEGER PRIMARY KEY,
+                  username TEXT,
+                  date TEXT,
+                  adherence REAL,
+                  updated TEXT,
+                  UNIQUE(username, date),
+                  FOREIGN KEY(username) REFERENCES users(username))''')
+    c.execute('''INSERT INTO adherence_history_new (id, username, date, adherence, updated)
+                 SELECT id, username, date, adherence, updated FROM adherence_history''')
+    c.execute('DROP TABLE adherence_history')
+    c.execute('ALTER TABLE adherence_history_new RENAME TO adherence_history')
+
+def migration_reminder_queue(conn):
+    """Turn reminders into a per-slot, per-day queue with acknowledgement tracking"""
+    c = conn.cursor()
+    
+    c.execute('ALTER TABLE reminders ADD COLUMN fired_at TEXT')
+    c.execute('ALTER TABLE reminders ADD COLUMN acknowledged_at TEXT')
+    # reminder_time is "YYYY-MM-DD HH:MM"; keep one row per dose slot per day
+    c.execute('''DELETE FROM reminders
+                 WHERE id NOT IN (SELECT MIN(id) FROM reminders GROUP BY username, medication_id, reminder_time)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_slot
+                 ON reminders(username, medication_id, reminder_time)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_reminders_pending
+                 ON reminders(username, acknowledged, reminder_time)''')
+    c.execute('DROP INDEX IF EXISTS idx_reminders_username')
+
+def migration_dose_slots(conn):
+    """Store every medication's dose times and taken doses in normalized slot tables.
+
+    ``medication_slots`` holds one row per (medication, minute of day) and
+    ``dose_events`` one row per slot taken on a date. Existing medications
+    get a slot for their main time and today's acknowledged reminders are
+    carried over as dose events.
+    """
+    c = conn.cursor()
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS medication_slots
+                 (id INTEGER PRIMARY KEY,
+                  medication_id INTEGER NOT NULL,
+                  slot_minute INTEGER NOT NULL,
+                  UNIQUE(medication_id, slot_minute),
+                  FOREIGN KEY(medication_id) REFERENCES medications(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS dose_events
+                 (slot_id INTEGER NOT NULL,
+                  date TEXT NOT NULL,
+                  taken_at TEXT,
+                  PRIMARY KEY(slot_id, date),
+                  FOREIGN KEY(slot_id) REFERENCES medication_slots(id)) WITHOUT ROWID''')
+    
+    c.execute('''INSERT OR IGNORE INTO medication_slots (medication_id, slot_minute)
+                 SELECT id, CAST(substr(time, 1, 2) AS INTEGER) * 60 + CAST(substr(time, 4, 2) AS INTEGER)
+                 FROM medications
+                 WHERE time GLOB '[0-2][0-9]:[0-5][0-9]' ''')
+    c.execute('''INSERT OR IGNORE INTO dose_events (slot_id, date, taken_at)
+                 SELECT s.id, substr(r.reminder_time, 1, 10), COALESCE(r.acknowledged_at, r.created_at)
+                 FROM reminders r
+                 JOIN medication_slots s
+                   ON s.medication_id = r.medication_id
+                  AND s.slot_minute = CAST(substr(r.reminder_time, 12, 2) AS INTEGER) * 60
+                                      + CAST(substr(r.reminder_time, 15, 2) AS INTEGER)
+                 WHERE r.acknowledged = 1''')
+
+def migration_daily_rollover(conn):
+    """Track each user's timezone and the last local date their dose state was rolled over.
+
+    Existing users are treated as rolled over on the last day they recorded a
+    dose (today if they never did), so the first rollover closes that day out.
+    """
+    c = conn.cursor()
+    
+    c.execute('ALTER TABLE users ADD COLUMN timezone TEXT')
+    c.execute('ALTER TABLE users ADD COLUMN last_rollover_date TEXT')
+    c.execute('''UPDATE users SET last_rollover_date = COALESCE(
+                     (SELECT MAX(date) FROM medication_history WHERE medication_history.username = users.username),
+                     date('now', 'localtime'))''')
+
+def migration_history_timestamp_index(conn):
+    """Index medication_history in (timestamp, id) order per user for keyset paging"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_medication_history_username_timestamp
+                    ON medication_history(username, timestamp, id)''')
+
+def migration_slot_reminder_index(conn):
+    """Record each dose slot's position in reminder_times, NULL for a main-time-only slot.
+
+    Existing medications with several slots were saved from forms whose
+    reminder_times start with the main time, so that slot comes first and the
+    rest follow in time order; single-slot medications have no reminder_times.
+    """
+    c = conn.cursor()
+    
+    c.execute('ALTER TABLE medication_slots ADD COLUMN reminder_index INTEGER')
+    slots = {}
+    rows = c.execute('''SELECT s.id, s.medication_id, s.slot_minute,
+                               CASE WHEN m.time GLOB '[0-2][0-9]:[0-5][0-9]'
+                                    THEN CAST(substr(m.time, 1, 2) AS INTEGER) * 60 + CAST(substr(m.time, 4, 2) AS INTEGER)
+                               END
+                        FROM medication_slots s
+                        JOIN medications m ON m.id = s.medication_id''').fetchall()
+    for slot_id, medication_id, minute, main_minute in rows:
+        slots.setdefault(medication_id, []).append((minute != main_minute, minute, slot_id))
+    c.executemany('UPDATE medication_slots SET reminder_index = ? WHERE id = ?',
+                  [(index, slot_id)
+                   for med_slots in slots.values() if len(med_slots) > 1
+                   for index, (_, _, slot_id) in enumerate(sorted(med_slots))])
+
+# Ordered schema migrations: (version, name, function taking a connection)
+MIGRATIONS = [
+    (1, 'initial schema', migration_initial_schema),
+    (2, 'lookup indexes', migration_lookup_indexes),
+    (3, 'adherence upsert key', migration_adherence_upsert_key),
+    (4, 'reminder queue', migration_reminder_queue),
+    (5, 'dose slots', migration_dose_slots),
+    (6, 'daily rollover', migration_daily_rollover),
+    (7, 'history timestamp index', migration_history_timestamp_index),
+    (8, 'slot reminder index', migration_slot_reminder_index),
+]
 
 def get_age_category(age):
     """Determine age category based on age"""
@@ -173,13 +590,15 @@ def get_secondary_color(age_category):
     else:
         return "#ca8a04"
 
+@functools.lru_cache(maxsize=None)
 def format_time(time_str):
-    """Format time string"""
+    """Format an "HH:MM" time string as a 12-hour clock label"""
     try:
-        time_obj = datetime.strptime(time_str, "%H:%M")
-        return time_obj.strftime("%I:%M %p")
-    except:
+        minutes = time_to_minutes(time_str)
+    except (ValueError, AttributeError):
         return time_str
+    hour, minute = divmod(minutes, 60)
+    return f"{hour % 12 or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
 
 def get_custom_medication_times(frequency):
     """Get default custom medication times based on frequency"""
@@ -233,77 +652,123 @@ def play_notification_sound():
     """
     st.markdown(audio_html, unsafe_allow_html=True)
 
+@functools.lru_cache(maxsize=None)
+def time_to_minutes(time_str):
+    """Convert an "HH:MM" string to minutes since midnight"""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+@functools.lru_cache(maxsize=None)
+def slot_minute(time_str):
+    """Get the minute of day of an "HH:MM" dose time, or None for legacy values such as 'morning'"""
+    try:
+        hours, minutes = (int(part) for part in time_str.split(':'))
+    except (ValueError, AttributeError):
+        return None
+    return hours * 60 + minutes if 0 <= hours < 24 and 0 <= minutes < 60 else None
+
+@functools.lru_cache(maxsize=None)
+def minutes_to_time(minutes):
+    """Convert minutes since midnight back to an "HH:MM" string"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def zone_info(tz_name):
+    """Get the ZoneInfo for ``tz_name``, or None if it is unset or unknown"""
+    if tz_name:
+        try:
+            return ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return None
+
+def zone_now(tz_name=None):
+    """Get the current wall-clock time in ``tz_name`` (server time if unset or unknown)"""
+    zone = zone_info(tz_name)
+    return datetime.now(zone).replace(tzinfo=None) if zone else datetime.now()
+
+def user_now():
+    """Get the current wall-clock time in the user's timezone (server time if unset)"""
+    return zone_now((st.session_state.get('user_profile') or {}).get('timezone'))
+
+def browser_timezone():
+    """Get the IANA timezone reported by the user's browser, or None if it is missing or unknown"""
+    tz_name = st.context.timezone
+    return tz_name if zone_info(tz_name) else None
+
+def current_minute(now=None):
+    """Get the current minute of the day in the user's timezone"""
+    now = now or user_now()
+    return now.hour * 60 + now.minute
+
+def build_schedule_index(medications):
+    """Build the sorted (minute_of_day, med_id, slot) index of every dose slot (malformed times are skipped)"""
+    entries = set()
+    for med in medications:
+        slots = set(med.get('reminder_times') or [])
+        slots.add(med.get('time', '00:00'))
+        for slot in slots:
+            minute = slot_minute(slot)
+            if minute is not None:
+                entries.add((minute, med['id'], slot))
+    return sorted(entries)
+
+def get_schedule_index():
+    """Get today's schedule index, rebuilding it after medication edits or at date rollover"""
+    today = user_now().strftime("%Y-%m-%d")
+    index = st.session_state.get('schedule_index')
+    if index is None or index['date'] != today:
+        entries = build_schedule_index(st.session_state.medications)
+        index = {'date': today, 'entries': entries, 'minutes': [entry[0] for entry in entries]}
+        st.session_state.schedule_index = index
+        if st.session_state.get('user_profile'):
+            run_write(materialize_reminders, st.session_state.user_profile['username'], today, entries)
+    return index
+
+def invalidate_schedule_index():
+    """Drop the cached schedule index; call whenever medications or their times change"""
+    st.session_state.schedule_index = None
+
+def is_slot_pending(med, slot):
+    """Check whether a dose slot of a medication still has to be taken today"""
+    if slot in med.get('taken_time_slots', []):
+        return False
+    if med.get('taken_today', False) and slot == med.get('time') and slot not in (med.get('reminder_times') or []):
+        return False
+    return True
+
 def categorize_medications_by_status():
     """Categorize medications into missed, upcoming, and taken"""
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
-    
-    missed = []
-    upcoming = []
-    taken = []
-    
-    for med in st.session_state.medications:
-        med_time = med.get('time', '00:00')
-        
-        # Track which time slots have been taken
-        taken_time_slots = med.get('taken_time_slots', [])
-        
-        if med.get('reminder_times'):
-            for time_slot in med['reminder_times']:
-                if time_slot in taken_time_slots:
-                    # This specific time slot has been taken
-                    continue
-                elif time_slot < current_time:
-                    # Missed this time slot
-                    if not any(m['id'] == med['id'] and m['time'] == time_slot for m in missed):
-                        missed.append({
-                            'id': med['id'],
-                            'name': med['name'],
-                            'time': time_slot,
-                            'dosageAmount': med['dosageAmount'],
-                            'color': med.get('color', 'blue'),
-                            'unique_key': f"{med['id']}_{time_slot.replace(':', '')}"
-                        })
-                elif time_slot > current_time:
-                    # Upcoming time slot
-                    if not any(m['id'] == med['id'] and m['time'] == time_slot for m in upcoming):
-                        upcoming.append({
-                            'id': med['id'],
-                            'name': med['name'],
-                            'time': time_slot,
-                            'dosageAmount': med['dosageAmount'],
-                            'color': med.get('color', 'blue'),
-                            'unique_key': f"{med['id']}_{time_slot.replace(':', '')}"
-                        })
-        
-        # Handle the main medication time
-        if med.get('taken_today', False):
-            taken.append(med)
-        elif med_time < current_time and med_time not in taken_time_slots:
-            # Missed main time and not taken yet
-            if not any(m['id'] == med['id'] and m['time'] == med_time for m in missed):
-                missed.append({
-                    'id': med['id'],
-                    'name': med['name'],
-                    'time': med_time,
-                    'dosageAmount': med['dosageAmount'],
-                    'color': med.get('color', 'blue'),
-                    'unique_key': f"{med['id']}_{med_time.replace(':', '')}"
-                })
-        elif med_time > current_time and med_time not in taken_time_slots:
-            # Upcoming main time and not taken yet
-            if not any(m['id'] == med['id'] and m['time'] == med_time for m in upcoming):
-                upcoming.append({
-                    'id': med['id'],
-                    'name': med['name'],
-                    'time': med_time,
-                    'dosageAmount': med['dosageAmount'],
-                    'color': med.get('color', 'blue'),
-                    'unique_key': f"{med['id']}_{med_time.replace(':', '')}"
-                })
+    now = user_now()
+    now_minute = current_minute(now)
+    
+    index = get_schedule_index()  # materializes today's reminders if needed
+    meds_by_id = {med['id']: med for med in st.session_state.medications}
+    # Reminders left unacknowledged before the current minute are missed, slots after it are upcoming
+    day_start, _ = reminder_day_bounds(index['date'])
+    missed_entries = [(None, reminder['medication_id'], reminder['reminder_time'][11:])
+                      for reminder in fetch_unacknowledged_reminders(st.session_state.user_profile['username'],
+                                                                     day_start, now)]
+    upcoming_start = bisect.bisect_right(index['minutes'], now_minute)
+    
+    def slot_entries(entries):
+        result = []
+        for _, med_id, slot in entries:
+            med = meds_by_id.get(med_id)
+            if med is None or not is_slot_pending(med, slot):
+                continue
+            result.append({
+                'id': med['id'],
+                'name': med['name'],
+                'time': slot,
+                'dosageAmount': med['dosageAmount'],
+                'color': med.get('color', 'blue'),
+                'unique_key': f"{med['id']}_{slot.replace(':', '')}"
+            })
+        return result
     
-    missed.sort(key=lambda x: x['time'])
-    upcoming.sort(key=lambda x: x['time'])
+    missed = slot_entries(missed_entries)
+    upcoming = slot_entries(index['entries'][upcoming_start:])
+    taken = [med for med in st.session_state.medications if med.get('taken_today', False)]
     
     return missed, upcoming, taken
 
@@ -398,51 +863,40 @@ def update_mascot_mood(adherence):
 
 def check_upcoming_reminders(upcoming_meds):
     """Check for upcoming medications and show reminders"""
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
+    now_minute = current_minute()
     
     for med in upcoming_meds[:3]:
-        med_time = datetime.strptime(med['time'], "%H:%M")
-        time_diff = (med_time - now).total_seconds() / 60
+        minute = slot_minute(med['time'])
+        if minute is None:
+            continue
+        time_diff = minute - now_minute
         
         if 0 < time_diff <= 30:
-            st.warning(f"⏰ **Upcoming Reminder:** {med['name']} ({med['dosageAmount']}) at {med['time']} - Take in {int(time_diff)} minutes!")
+            st.warning(f"⏰ **Upcoming Reminder:** {med['name']} ({med['dosageAmount']}) at {med['time']} - Take in {time_diff} minutes!")
             return True
     return False
 
-def check_due_medications(medications):
-    """Check for medications that are due now and trigger reminders"""
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
+def check_due_medications(medications, window=5):
+    """Find medications with a dose due within ``window`` minutes.
+
+    Reads the unacknowledged slice of today's reminder queue and returns
+    ``(medication, due_slot)`` pairs, one per medication; a due reminder
+    slot takes precedence over the main medication time.
+    """
+    get_schedule_index()  # materializes today's reminders if needed
+    meds_by_id = {med['id']: med for med in medications}
     
-    due_medications = []
-    for med in medications:
-        taken_time_slots = med.get('taken_time_slots', [])
-        med_time = med.get('time', '00:00')
-        
-        # Check main medication time
-        if med_time not in taken_time_slots:
-            med_datetime = datetime.strptime(med_time, "%H:%M").replace(
-                year=now.year, month=now.month, day=now.day
-            )
-            time_diff = abs((now - med_datetime).total_seconds() / 60)
-            
-            if time_diff <= 5:
-                due_medications.append(med)
-        
-        # Check reminder times
-        if med.get('reminder_times'):
-            for reminder_time in med['reminder_times']:
-                if reminder_time not in taken_time_slots:
-                    reminder_datetime = datetime.strptime(reminder_time, "%H:%M").replace(
-                        year=now.year, month=now.month, day=now.day
-                    )
-                    time_diff = abs((now - reminder_datetime).total_seconds() / 60)
-                    
-                    if time_diff <= 5:
-                        due_medications.append(med)
-                        break  # Don't add the same medication twice
+    due_slots = {}
+    for med_id, slot in fetch_due_reminders(st.session_state.user_profile['username'], user_now(), window):
+        med = meds_by_id.get(med_id)
+        if med is not None and slot not in med.get('taken_time_slots', []):
+            due_slots.setdefault(med_id, []).append(slot)
     
+    due_medications = []
+    for med_id, slots in due_slots.items():
+        med = meds_by_id[med_id]
+        reminder_slots = [slot for slot in slots if slot in (med.get('reminder_times') or [])]
+        due_medications.append((med, (reminder_slots or slots)[0]))
     return due_medications
 
 def calculate_adherence(medications):
@@ -493,7 +947,7 @@ def days_until(date_str):
     """Calculate days until a date"""
     try:
         target_date = datetime.strptime(date_str, "%Y-%m-%d")
-        today = datetime.now()
+        today = user_now()
         delta = target_date - today
         return delta.days
     except:
@@ -501,7 +955,7 @@ def days_until(date_str):
 
 def get_time_of_day():
     """Get current time of day greeting"""
-    hour = datetime.now().hour
+    hour = user_now().hour
     if hour < 12:
         return "Good Morning"
     elif hour < 18:
@@ -512,14 +966,12 @@ def get_time_of_day():
 def check_medication_conflicts(medications, new_medication):
     """Check for potential medication time conflicts"""
     conflicts = []
-    new_time = new_medication.get('time', '00:00')
+    new_minute = slot_minute(new_medication.get('time', '00:00'))
+    if new_minute is None:
+        return conflicts
     for med in medications:
-        med_time = med.get('time', '00:00')
-        time_diff = abs(
-            datetime.strptime(new_time, "%H:%M") - 
-            datetime.strptime(med_time, "%H:%M")
-        )
-        if time_diff.total_seconds() < 1800:
+        minute = slot_minute(med.get('time', '00:00'))
+        if minute is not None and abs(new_minute - minute) < 30:
             conflicts.append(med['name'])
     return conflicts
 
@@ -549,10 +1001,6 @@ def initialize_session_state():
         st.session_state.signup_data = {}
     if 'dark_mode' not in st.session_state:
         st.session_state.dark_mode = False
-    if 'medication_history' not in st.session_state:
-        st.session_state.medication_history = []
-    if 'adherence_history' not in st.session_state:
-        st.session_state.adherence_history = []
     if 'connected_patients' not in st.session_state:
         st.session_state.connected_patients = []
     if 'editing_medication' not in st.session_state:
@@ -571,70 +1019,188 @@ def initialize_session_state():
         if 'taken_time_slots' not in med:
             med['taken_time_slots'] = []
 
+def next_entity_id(items):
+    """Get a session-local id that does not collide with any existing entity"""
+    ids = [int(item['id']) for item in items if str(item.get('id', '')).isdigit()]
+    return max(ids, default=0) + 1
+
+def _now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _user_row(profile):
+    return (profile.get('name'), profile.get('age'), profile.get('email', ''),
+            profile.get('password', ''), profile.get('userType'), profile.get('phone', ''),
+            profile.get('relationship', ''), profile.get('experience', ''), profile.get('notes', ''),
+            profile.get('timezone'))
+
+def _disease_row(disease):
+    return (disease.get('name'), disease.get('type'), disease.get('notes', ''))
+
+def _medication_row(med):
+    med.setdefault('created_at', _now_str())
+    return (med.get('name'), med.get('dosageType'), med.get('dosageAmount'),
+            med.get('frequency'), med.get('time'), med.get('color'),
+            med.get('instructions', ''), int(med.get('taken_today', False)), med['created_at'])
+
+def medication_dose_slots(med):
+    """Get the sorted (minute of day, reminder index) pairs of every dose slot of a medication.
+
+    The reminder index is the slot's position in ``reminder_times``, or None
+    for the main ``time`` when it is not one of them, so the list can be
+    rebuilt exactly as it was saved. Times that are not "HH:MM" (legacy
+    rows) get no slot, as in the dose slots migration.
+    """
+    slots = {}
+    for index, slot in enumerate(med.get('reminder_times') or []):
+        minute = slot_minute(slot)
+        if minute is not None:
+            slots.setdefault(minute, index)
+    minute = slot_minute(med.get('time'))
+    if minute is not None:
+        slots.setdefault(minute, None)
+    return tuple(sorted(slots.items()))
+
+def _appointment_row(appt):
+    appt.setdefault('created_at', _now_str())
+    return (appt.get('doctor'), appt.get('specialty'), appt.get('date'), appt.get('time'),
+            appt.get('location', ''), appt.get('phone', ''), appt.get('notes', ''), appt['created_at'])
+
+def _side_effect_row(effect):
+    effect.setdefault('reported_at', _now_str())
+    return (effect.get('medication'), effect.get('severity'), effect.get('type', ''),
+            effect.get('description'), effect.get('date'), effect['reported_at'])
+
+# Table name -> (persisted columns, row builder) for every per-user entity list
+ENTITY_TABLES = {
+    'diseases': (('name', 'type', 'notes'), _disease_row),
+    'medications': (('name', 'dosage_type', 'dosage_amount', 'frequency', 'time', 'color',
+                     'instructions', 'taken_today', 'created_at'), _medication_row),
+    'appointments': (('doctor', 'specialty', 'date', 'time', 'location', 'phone', 'notes',
+                      'created_at'), _appointment_row),
+    'side_effects': (('medication', 'severity', 'type', 'description', 'date', 'reported_at'),
+                     _side_effect_row),
+}
+
+def snapshot_user_rows(profile, entities):
+    """Build the persisted-state snapshot used to detect dirty entities on save"""
+    snapshot = {'users': _user_row(profile) if profile else None}
+    for table, (_, to_row) in ENTITY_TABLES.items():
+        snapshot[table] = {str(item['id']): to_row(item) for item in entities.get(table, [])}
+    snapshot['medication_slots'] = {str(med['id']): medication_dose_slots(med)
+                                    for med in entities.get('medications', [])}
+    return snapshot
+
+def sync_user_rows(conn, username, profile, entities, persisted):
+    """Write only the rows that changed since the ``persisted`` snapshot.
+
+    Entities whose id is not in the snapshot are inserted, changed rows are
+    updated in place and rows that disappeared are deleted, so database ids
+    stay stable across saves. Returns the new snapshot and the list of
+    ``(entity, row_id)`` pairs for freshly inserted entities; the caller
+    assigns those ids once the transaction has committed.
+    """
+    persisted = persisted or {}
+    c = conn.cursor()
+    snapshot = {}
+    inserted = []
+    medications = {}
+    
+    user_row = _user_row(profile)
+    if user_row != persisted.get('users'):
+        c.execute('''INSERT INTO users
+                     (username, name, age, email, password, user_type, phone, relationship, experience, notes,
+                      timezone, created_at, last_rollover_date)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(username) DO UPDATE SET
+                        name = excluded.name, age = excluded.age, email = excluded.email,
+                        password = excluded.password, user_type = excluded.user_type,
+                        phone = excluded.phone, relationship = excluded.relationship,
+                        experience = excluded.experience, notes = excluded.notes,
+                        timezone = excluded.timezone''',
+                  (username,) + user_row + (_now_str(), zone_now(profile.get('timezone')).strftime("%Y-%m-%d")))
+    snapshot['users'] = user_row
+    
+    for table, (columns, to_row) in ENTITY_TABLES.items():
+        old_rows = persisted.get(table, {})
+        new_rows = {}
+        insert_sql = (f"INSERT INTO {table} (username, {', '.join(columns)}) "
+                      f"VALUES (?, {', '.join('?' for _ in columns)})")
+        update_sql = (f"UPDATE {table} SET {', '.join(f'{col} = ?' for col in columns)} "
+                      f"WHERE id = ? AND username = ?")
+        
+        for item in entities.get(table, []):
+            row = to_row(item)
+            row_id = str(item.get('id'))
+            if row_id in old_rows and row_id not in new_rows:
+                if old_rows[row_id] != row:
+                    c.execute(update_sql, row + (int(row_id), username))
+            else:
+                c.execute(insert_sql, (username,) + row)
+                inserted.append((item, c.lastrowid))
+                row_id = str(c.lastrowid)
+            new_rows[row_id] = row
+            if table == 'medications':
+                medications[row_id] = item
+        
+        removed = [(int(row_id), username) for row_id in old_rows if row_id not in new_rows]
+        if removed:
+            c.executemany(f"DELETE FROM {table} WHERE id = ? AND username = ?", removed)
+        snapshot[table] = new_rows
+    
+    snapshot['medication_slots'] = sync_medication_slots(c, medications, persisted.get('medication_slots', {}))
+    return snapshot, inserted
+
+def sync_medication_slots(c, medications, persisted):
+    """Write the dose slots of medications whose times changed; returns the new slot snapshot.
+
+    ``medications`` maps saved medication ids to session medications. Slots
+    (and their dose events) of removed times and deleted medications are
+    dropped.
+    """
+    slots = {row_id: medication_dose_slots(med) for row_id, med in medications.items()}
+    removed = []
+    changed = []
+    for row_id in set(slots) | set(persisted):
+        old, new = dict(persisted.get(row_id, ())), dict(slots.get(row_id, ()))
+        removed.extend((int(row_id), minute) for minute in old.keys() - new.keys())
+        # Slots whose reminder index moved are updated in place so their dose events survive
+        changed.extend((int(row_id), minute, index) for minute, index in new.items()
+                       if minute not in old or old[minute] != index)
+    
+    if removed:
+        c.executemany('''DELETE FROM dose_events WHERE slot_id IN
+                         (SELECT id FROM medication_slots WHERE medication_id = ? AND slot_minute = ?)''', removed)
+        c.executemany('DELETE FROM medication_slots WHERE medication_id = ? AND slot_minute = ?', removed)
+    if changed:
+        c.executemany('''INSERT INTO medication_slots (medication_id, slot_minute, reminder_index) VALUES (?, ?, ?)
+                         ON CONFLICT(medication_id, slot_minute) DO UPDATE SET reminder_index = excluded.reminder_index''',
+                      changed)
+    return slots
+
+def _session_entities():
+    return {
+        'diseases': st.session_state.user_profile.get('diseases', []),
+        'medications': st.session_state.medications,
+        'appointments': st.session_state.appointments,
+        'side_effects': st.session_state.side_effects,
+    }
+
 def save_user_data():
-    """Save user data to SQLite database"""
+    """Save changed user data to SQLite database"""
     if not st.session_state.user_profile:
         return False
     
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        
         username = st.session_state.user_profile.get('username')
+        snapshot, inserted = run_write(sync_user_rows, username, st.session_state.user_profile,
+                                       _session_entities(), st.session_state.get('persisted_rows'))
         
-        c.execute('''INSERT OR REPLACE INTO users 
-                     (username, name, age, email, password, user_type, phone, relationship, experience, notes, created_at)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (username,
-                   st.session_state.user_profile.get('name'),
-                   st.session_state.user_profile.get('age'),
-                   st.session_state.user_profile.get('email', ''),
-                   st.session_state.user_profile.get('password', ''),
-                   st.session_state.user_profile.get('userType'),
-                   st.session_state.user_profile.get('phone', ''),
-                   st.session_state.user_profile.get('relationship', ''),
-                   st.session_state.user_profile.get('experience', ''),
-                   st.session_state.user_profile.get('notes', ''),
-                   datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        
-        c.execute('DELETE FROM diseases WHERE username = ?', (username,))
-        for disease in st.session_state.user_profile.get('diseases', []):
-            c.execute('INSERT INTO diseases (username, name, type, notes) VALUES (?, ?, ?, ?)',
-                     (username, disease.get('name'), disease.get('type'), disease.get('notes', '')))
-        
-        c.execute('DELETE FROM medications WHERE username = ?', (username,))
-        for med in st.session_state.medications:
-            # Serialize taken_time_slots to JSON string for storage
-            taken_slots_json = json.dumps(med.get('taken_time_slots', []))
-            
-            c.execute('''INSERT INTO medications 
-                         (username, name, dosage_type, dosage_amount, frequency, time, color, instructions, taken_today, created_at)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (username, med.get('name'), med.get('dosageType'), med.get('dosageAmount'),
-                      med.get('frequency'), med.get('time'), med.get('color'),
-                      med.get('instructions', ''), int(med.get('taken_today', False)),
-                      med.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))))
-        
-        c.execute('DELETE FROM appointments WHERE username = ?', (username,))
-        for appt in st.session_state.appointments:
-            c.execute('''INSERT INTO appointments 
-                         (username, doctor, specialty, date, time, location, phone, notes, created_at)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (username, appt.get('doctor'), appt.get('specialty'), appt.get('date'),
-                      appt.get('time'), appt.get('location', ''), appt.get('phone', ''),
-                      appt.get('notes', ''), appt.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))))
-        
-        c.execute('DELETE FROM side_effects WHERE username = ?', (username,))
-        for effect in st.session_state.side_effects:
-            c.execute('''INSERT INTO side_effects 
-                         (username, medication, severity, type, description, date, reported_at)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (username, effect.get('medication'), effect.get('severity'),
-                      effect.get('type', ''), effect.get('description'),
-                      effect.get('date'), effect.get('reported_at', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))))
-        
-        conn.commit()
-        conn.close()
+        for item, row_id in inserted:
+            item['id'] = str(row_id) if isinstance(item.get('id'), str) else row_id
+        if inserted:
+            invalidate_schedule_index()
+        st.session_state.persisted_rows = snapshot
+        bump_data_version()
         return True
     except Exception as e:
         st.error(f"Error saving data: {e}")
@@ -643,184 +1209,387 @@ def save_user_data():
 def load_user_data(username):
     """Load user data from SQLite database"""
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('SELECT * FROM users WHERE username = ?', (username,))
-        user = c.fetchone()
-        
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
         if not user:
-            conn.close()
             return False
         
-        st.session_state.user_profile = {
-            'username': user[0],
-            'name': user[1],
-            'age': user[2],
-            'email': user[3],
-            'password': user[4],
-            'userType': user[5],
-            'phone': user[6],
-            'relationship': user[7],
-            'experience': user[8],
-            'notes': user[9],
-            'diseases': []
-        }
+        # Doses roll over at the user's own midnight, so follow the browser when it moves zones
+        timezone = browser_timezone() or user[11]
+        if timezone != user[11]:
+            run_write(record_user_timezone, username, timezone)
         
-        c.execute('SELECT * FROM diseases WHERE username = ?', (username,))
-        diseases = c.fetchall()
-        for disease in diseases:
-            st.session_state.user_profile['diseases'].append({
-                'id': str(disease[0]),
-                'name': disease[2],
-                'type': disease[3],
-                'notes': disease[4]
-            })
+        # Close out this user's last day if their midnight has passed; the scheduler rolls everyone else over
+        if (user[12] or '') < zone_now(timezone).strftime("%Y-%m-%d"):
+            run_write(rollover_users, username)
         
-        c.execute('SELECT * FROM medications WHERE username = ?', (username,))
-        meds = c.fetchall()
-        st.session_state.medications = []
-        for med in meds:
-            # Initialize taken_time_slots as empty list for loaded medications
-            med_obj = {
-                'id': med[0],
-                'name': med[2],
-                'dosageType': med[3],
-                'dosageAmount': med[4],
-                'frequency': med[5],
-                'time': med[6],
-                'color': med[7],
-                'instructions': med[8],
-                'taken_today': bool(med[9]),
-                'created_at': med[10],
-                'taken_time_slots': []  # Initialize empty taken_time_slots
+        with get_db_connection() as conn:
+            c = conn.cursor()
+        
+            st.session_state.user_profile = {
+                'username': user[0],
+                'name': user[1],
+                'age': user[2],
+                'email': user[3],
+                'password': user[4],
+                'userType': user[5],
+                'phone': user[6],
+                'relationship': user[7],
+                'experience': user[8],
+                'notes': user[9],
+                'timezone': timezone,
+                'diseases': []
             }
-            st.session_state.medications.append(med_obj)
         
-        c.execute('SELECT * FROM appointments WHERE username = ?', (username,))
-        appts = c.fetchall()
-        st.session_state.appointments = []
-        for appt in appts:
-            st.session_state.appointments.append({
-                'id': appt[0],
-                'doctor': appt[2],
-                'specialty': appt[3],
-                'date': appt[4],
-                'time': appt[5],
-                'location': appt[6],
-                'phone': appt[7],
-                'notes': appt[8],
-                'created_at': appt[9]
-            })
+            c.execute('SELECT * FROM diseases WHERE username = ?', (username,))
+            diseases = c.fetchall()
+            for disease in diseases:
+                st.session_state.user_profile['diseases'].append({
+                    'id': str(disease[0]),
+                    'name': disease[2],
+                    'type': disease[3],
+                    'notes': disease[4]
+                })
         
-        c.execute('SELECT * FROM side_effects WHERE username = ?', (username,))
-        effects = c.fetchall()
-        st.session_state.side_effects = []
-        for effect in effects:
-            st.session_state.side_effects.append({
-                'id': effect[0],
-                'medication': effect[2],
-                'severity': effect[3],
-                'type': effect[4],
-                'description': effect[5],
-                'date': effect[6],
-                'reported_at': effect[7]
-            })
+            # One row per dose slot, with today's dose event (if any) joined in
+            c.execute('''SELECT m.id, m.name, m.dosage_type, m.dosage_amount, m.frequency, m.time, m.color,
+                                m.instructions, m.taken_today, m.created_at, s.slot_minute, d.slot_id, s.reminder_index
+                         FROM medications m
+                         LEFT JOIN medication_slots s ON s.medication_id = m.id
+                         LEFT JOIN dose_events d ON d.slot_id = s.id AND d.date = ?
+                         WHERE m.username = ?
+                         ORDER BY m.id, s.reminder_index''', (user_now().strftime("%Y-%m-%d"), username))
+            meds = {}
+            for med in c.fetchall():
+                med_obj = meds.get(med[0])
+                if med_obj is None:
+                    med_obj = meds[med[0]] = {
+                        'id': med[0],
+                        'name': med[1],
+                        'dosageType': med[2],
+                        'dosageAmount': med[3],
+                        'frequency': med[4],
+                        'time': med[5],
+                        'color': med[6],
+                        'instructions': med[7],
+                        'taken_today': bool(med[8]),
+                        'created_at': med[9],
+                        'reminder_times': [],
+                        'taken_time_slots': []
+                    }
+                if med[10] is not None:
+                    slot = minutes_to_time(med[10])
+                    # The main time's own slot has no reminder index unless it is also a reminder time
+                    if med[12] is not None:
+                        med_obj['reminder_times'].append(slot)
+                    if med[11] is not None:
+                        med_obj['taken_time_slots'].append(slot)
+            for med_obj in meds.values():
+                if not med_obj['reminder_times']:
+                    del med_obj['reminder_times']
+            st.session_state.medications = list(meds.values())
+            invalidate_schedule_index()
         
-        c.execute('SELECT * FROM medication_history WHERE username = ?', (username,))
-        hist = c.fetchall()
-        st.session_state.medication_history = []
-        for h in hist:
-            st.session_state.medication_history.append({
-                'medication_id': h[2],
-                'action': h[3],
-                'timestamp': h[4],
-                'date': h[5]
-            })
+            c.execute('SELECT * FROM appointments WHERE username = ?', (username,))
+            appts = c.fetchall()
+            st.session_state.appointments = []
+            for appt in appts:
+                st.session_state.appointments.append({
+                    'id': appt[0],
+                    'doctor': appt[2],
+                    'specialty': appt[3],
+                    'date': appt[4],
+                    'time': appt[5],
+                    'location': appt[6],
+                    'phone': appt[7],
+                    'notes': appt[8],
+                    'created_at': appt[9]
+                })
         
-        c.execute('SELECT * FROM adherence_history WHERE username = ?', (username,))
-        adh = c.fetchall()
-        st.session_state.adherence_history = []
-        for a in adh:
-            st.session_state.adherence_history.append({
-                'date': a[2],
-                'adherence': a[3],
-                'updated': a[4]
-            })
+            c.execute('SELECT * FROM side_effects WHERE username = ?', (username,))
+            effects = c.fetchall()
+            st.session_state.side_effects = []
+            for effect in effects:
+                st.session_state.side_effects.append({
+                    'id': effect[0],
+                    'medication': effect[2],
+                    'severity': effect[3],
+                    'type': effect[4],
+                    'description': effect[5],
+                    'date': effect[6],
+                    'reported_at': effect[7]
+                })
         
-        conn.close()
+            st.session_state.persisted_rows = snapshot_user_rows(st.session_state.user_profile, _session_entities())
+            st.session_state.rollover_date = user_now().strftime("%Y-%m-%d")
+        bump_data_version()
         return True
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return False
 
+def record_user_timezone(conn, username, timezone):
+    """Store the IANA timezone a user's local day is computed in"""
+    conn.execute('UPDATE users SET timezone = ? WHERE username = ?', (timezone, username))
+
 def user_exists(username):
     """Check if user exists"""
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT username FROM users WHERE username = ?', (username,))
-    result = c.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        result = conn.execute('SELECT username FROM users WHERE username = ?', (username,)).fetchone()
     return result is not None
 
-def update_medication_history(medication_id, action='taken'):
-    """Update medication history"""
+def reminder_day_bounds(day):
+    """Get the reminder_time range [start, end) covering one "YYYY-MM-DD" day"""
+    return f"{day} 00:00", f"{day} 24:00"
+
+def materialize_reminders(conn, username, day, entries):
+    """Make sure ``reminders`` holds exactly one row per dose slot of ``day``.
+
+    ``entries`` are schedule index entries. Missing slots are inserted,
+    unacknowledged rows for slots that no longer exist are removed, and
+    acknowledged rows are always kept.
+    """
+    start, end = reminder_day_bounds(day)
+    wanted = {(med_id, f"{day} {slot}") for _, med_id, slot in entries}
+    existing = conn.execute('''SELECT id, medication_id, reminder_time, acknowledged FROM reminders
+                               WHERE username = ? AND reminder_time >= ? AND reminder_time < ?''',
+                            (username, start, end)).fetchall()
+    
+    stale = [(row_id,) for row_id, med_id, reminder_time, acknowledged in existing
+             if not acknowledged and (med_id, reminder_time) not in wanted]
+    if stale:
+        conn.executemany('DELETE FROM reminders WHERE id = ?', stale)
+    
+    present = {(med_id, reminder_time) for _, med_id, reminder_time, _ in existing}
+    created_at = _now_str()
+    conn.executemany('''INSERT OR IGNORE INTO reminders
+                         (username, medication_id, reminder_time, acknowledged, created_at)
+                         VALUES (?, ?, ?, 0, ?)''',
+                     [(username, med_id, reminder_time, created_at)
+                      for med_id, reminder_time in sorted(wanted - present)])
+
+def acknowledge_reminders(conn, username, medication_id, reminder_times, now, acknowledged=True):
+    """Mark dose-slot reminders as acknowledged (taken) or back to pending at ``now``, the user's local time"""
+    now = now.strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany('''INSERT INTO reminders
+                         (username, medication_id, reminder_time, acknowledged, acknowledged_at, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(username, medication_id, reminder_time) DO UPDATE SET
+                            acknowledged = excluded.acknowledged,
+                            acknowledged_at = excluded.acknowledged_at''',
+                     [(username, medication_id, reminder_time, int(acknowledged),
+                       now if acknowledged else None, now)
+                      for reminder_time in reminder_times])
+
+def fetch_due_reminders(username, now, window=5):
+    """Fetch unacknowledged reminders due within ``window`` minutes of ``now``"""
+    start = (now - timedelta(minutes=window)).strftime("%Y-%m-%d %H:%M")
+    end = (now + timedelta(minutes=window)).strftime("%Y-%m-%d %H:%M")
+    with get_db_connection() as conn:
+        rows = conn.execute('''SELECT medication_id, reminder_time FROM reminders
+                               WHERE username = ? AND acknowledged = 0
+                                 AND reminder_time BETWEEN ? AND ?
+                               ORDER BY reminder_time''',
+                            (username, start, end)).fetchall()
+    return [(med_id, reminder_time[11:]) for med_id, reminder_time in rows]
+
+def fetch_unacknowledged_reminders(username, since, before):
+    """Fetch reminders that came due between ``since`` and ``before`` and were never acknowledged"""
+    with get_db_connection() as conn:
+        rows = conn.execute('''SELECT medication_id, reminder_time, fired_at FROM reminders
+                               WHERE username = ? AND acknowledged = 0
+                                 AND reminder_time >= ? AND reminder_time < ?
+                               ORDER BY reminder_time''',
+                            (username, since, before.strftime("%Y-%m-%d %H:%M"))).fetchall()
+    return [{'medication_id': r[0], 'reminder_time': r[1], 'fired_at': r[2]} for r in rows]
+
+def history_window(days):
+    """Get the (start_date, end_date) strings covering the last ``days`` days of the user's calendar"""
+    today = user_now().date()
+    return (today - timedelta(days=days)).strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
+
+def fetch_medication_history_page(username, start_date, end_date, after=None, limit=HISTORY_PAGE_SIZE):
+    """Fetch one page of medication history between two dates (inclusive).
+
+    Pages are ordered by (timestamp, id) and ``after`` is the cursor returned
+    by the previous page. The window is matched on ``timestamp`` (its first
+    ten characters are the date) so each page is a range scan of
+    idx_medication_history_username_timestamp that starts at the cursor and
+    needs no sort, no matter how deep into the history it is. Returns
+    ``(rows, cursor)``; the cursor is None once the window is exhausted.
+    """
+    after_timestamp, after_id = after or (start_date, 0)
+    day_after_end = (date.fromisoformat(end_date) + timedelta(days=1)).strftime("%Y-%m-%d")
+    with get_db_connection() as conn:
+        rows = conn.execute('''SELECT id, medication_id, action, timestamp, date
+                               FROM medication_history
+                               WHERE username = ? AND (timestamp, id) > (?, ?) AND timestamp < ?
+                               ORDER BY timestamp, id
+                               LIMIT ?''',
+                            (username, after_timestamp, after_id, day_after_end, limit)).fetchall()
+    
+    history = [{'medication_id': r[1], 'action': r[2], 'timestamp': r[3], 'date': r[4]} for r in rows]
+    cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+    return history, cursor
+
+def iter_medication_history(username, start_date, end_date, page_size=HISTORY_PAGE_SIZE):
+    """Yield medication history rows between two dates, one page at a time"""
+    cursor = None
+    while True:
+        page, cursor = fetch_medication_history_page(username, start_date, end_date, cursor, page_size)
+        yield from page
+        if cursor is None:
+            return
+
+def count_medication_history(username, start_date, end_date):
+    """Count the medication history rows between two dates (inclusive), over the same index range the pages scan"""
+    day_after_end = (date.fromisoformat(end_date) + timedelta(days=1)).strftime("%Y-%m-%d")
+    with get_db_connection() as conn:
+        return conn.execute('''SELECT COUNT(*) FROM medication_history
+                               WHERE username = ? AND timestamp >= ? AND timestamp < ?''',
+                            (username, start_date, day_after_end)).fetchone()[0]
+
+def fetch_adherence_history(username, start_date, end_date):
+    """Fetch the daily adherence rows between two dates (inclusive)"""
+    with get_db_connection() as conn:
+        rows = conn.execute('''SELECT date, adherence, updated FROM adherence_history
+                               WHERE username = ? AND date BETWEEN ? AND ?
+                               ORDER BY date''',
+                            (username, start_date, end_date)).fetchall()
+    return [{'date': r[0], 'adherence': r[1], 'updated': r[2]} for r in rows]
+
+def update_medication_history(medication_id, action='taken', slots=()):
+    """Update medication history and record or clear today's doses for ``slots``"""
     if not st.session_state.user_profile:
         return
     
     username = st.session_state.user_profile['username']
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute('''INSERT INTO medication_history (username, medication_id, action, timestamp, date)
-                 VALUES (?, ?, ?, ?, ?)''',
-             (username, medication_id, action,
-              datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-              datetime.now().strftime("%Y-%m-%d")))
-    
-    conn.commit()
-    conn.close()
+    now = user_now()
+    today = now.strftime("%Y-%m-%d")
+    reminder_times = [f"{today} {slot}" for slot in slots]
+    
+    def record(conn):
+        record_medication_event(conn, username, medication_id, action, now)
+        if slots:
+            acknowledge_reminders(conn, username, medication_id, reminder_times, now, action == 'taken')
+            record_dose_events(conn, medication_id, now, slots, action == 'taken')
+    
+    run_write(record)
+    bump_data_version()
+
+def record_medication_event(conn, username, medication_id, action, now):
+    """Append one medication history row stamped with ``now``, the user's local time"""
+    conn.execute('''INSERT INTO medication_history (username, medication_id, action, timestamp, date)
+                    VALUES (?, ?, ?, ?, ?)''',
+                 (username, medication_id, action,
+                  now.strftime("%Y-%m-%d %H:%M:%S"), now.strftime("%Y-%m-%d")))
+
+def record_dose_events(conn, medication_id, now, slots, taken=True):
+    """Record (or clear) the dose events of a medication's slots on the day of ``now``, the user's local time"""
+    day = now.strftime("%Y-%m-%d")
+    slot_keys = [(medication_id, time_to_minutes(slot)) for slot in slots]
+    if taken:
+        conn.executemany('''INSERT INTO dose_events (slot_id, date, taken_at)
+                            SELECT id, ?, ? FROM medication_slots WHERE medication_id = ? AND slot_minute = ?
+                            ON CONFLICT(slot_id, date) DO UPDATE SET taken_at = excluded.taken_at''',
+                         [(day, now.strftime("%Y-%m-%d %H:%M:%S")) + key for key in slot_keys])
+    else:
+        conn.executemany('''DELETE FROM dose_events WHERE date = ? AND slot_id IN
+                            (SELECT id FROM medication_slots WHERE medication_id = ? AND slot_minute = ?)''',
+                         [(day,) + key for key in slot_keys])
 
 def update_adherence_history():
-    """Update daily adherence history"""
+    """Update today's adherence from the saved medication state (call after save_user_data)"""
     if not st.session_state.user_profile:
         return
     
-    username = st.session_state.user_profile['username']
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    if st.session_state.medications:
-        taken = sum(1 for med in st.session_state.medications if med.get('taken_today', False))
-        total = len(st.session_state.medications)
-        adherence = (taken / total * 100) if total > 0 else 0
+    run_write(record_adherence, st.session_state.user_profile['username'],
+              user_now().strftime("%Y-%m-%d"))
+    bump_data_version()
+
+def record_adherence(conn, username, day):
+    """Upsert the adherence row for one day, computed from the user's medications"""
+    conn.execute('''INSERT INTO adherence_history (username, date, adherence, updated)
+                    SELECT ?, ?, COALESCE(100.0 * SUM(taken_today) / COUNT(*), 0), ?
+                    FROM medications WHERE username = ?
+                    ON CONFLICT(username, date) DO UPDATE SET
+                        adherence = excluded.adherence, updated = excluded.updated''',
+                 (username, day, datetime.now().strftime("%H:%M:%S"), username))
+
+def rollover_users(conn, username=None):
+    """Close out the previous day for every user whose local date has moved past it.
+
+    Local dates are computed once per distinct timezone; then, in one
+    transaction and without per-user round trips, each due user's final
+    adherence for their last day is upserted, ``taken_today`` is reset and
+    ``last_rollover_date`` advances. Taken slots need no reset because dose
+    events are keyed by date. Pass ``username`` to roll over only that user
+    (a primary-key lookup instead of a scan of ``users``). Returns the number
+    of users rolled over.
+    """
+    if username:
+        zones = [row[0] for row in conn.execute("SELECT COALESCE(timezone, '') FROM users WHERE username = ?",
+                                                (username,))]
     else:
-        adherence = 0
-    
-    conn = get_db_connection()
-    c = conn.cursor()
+        zones = [row[0] for row in conn.execute("SELECT DISTINCT COALESCE(timezone, '') FROM users")]
+    if not zones:
+        return 0
     
-    c.execute('SELECT id FROM adherence_history WHERE username = ? AND date = ?', (username, today))
-    existing = c.fetchone()
+    local_days = [(zone, zone_now(zone).strftime("%Y-%m-%d")) for zone in zones]
+    due_users = f'''WITH local_day(zone, today) AS (VALUES {', '.join('(?, ?)' for _ in local_days)}),
+                  due(username, last_day, today) AS (
+                      SELECT u.username, u.last_rollover_date, d.today
+                      FROM users u JOIN local_day d ON d.zone = COALESCE(u.timezone, '')
+                      WHERE COALESCE(u.last_rollover_date, '') < d.today{' AND u.username = ?' if username else ''})
+               '''
+    params = tuple(value for pair in local_days for value in pair) + ((username,) if username else ())
+    
+    conn.execute(due_users + '''INSERT INTO adherence_history (username, date, adherence, updated)
+                                SELECT due.username, due.last_day, 100.0 * SUM(m.taken_today) / COUNT(*), ?
+                                FROM due JOIN medications m ON m.username = due.username
+                                WHERE due.last_day IS NOT NULL
+                                GROUP BY due.username
+                                ON CONFLICT(username, date) DO UPDATE SET
+                                    adherence = excluded.adherence, updated = excluded.updated''',
+                 params + (datetime.now().strftime("%H:%M:%S"),))
+    conn.execute(due_users + '''UPDATE medications SET taken_today = 0
+                                WHERE taken_today != 0 AND username IN (SELECT username FROM due)''', params)
+    conn.execute(due_users + '''UPDATE users
+                                SET last_rollover_date = (SELECT today FROM due WHERE due.username = users.username)
+                                WHERE username IN (SELECT username FROM due)''', params)
+    # Cursor.rowcount is not reported for statements starting with WITH
+    return conn.execute('SELECT changes()').fetchone()[0]
+
+def ensure_daily_rollover():
+    """Reset the session's dose state on its first rerun after the user's midnight"""
+    if not st.session_state.user_profile:
+        return
     
-    if existing:
-        c.execute('UPDATE adherence_history SET adherence = ?, updated = ? WHERE id = ?',
-                 (adherence, datetime.now().strftime("%H:%M:%S"), existing[0]))
-    else:
-        c.execute('INSERT INTO adherence_history (username, date, adherence, updated) VALUES (?, ?, ?, ?)',
-                 (username, today, adherence, datetime.now().strftime("%H:%M:%S")))
+    today = user_now().strftime("%Y-%m-%d")
+    last_day = st.session_state.get('rollover_date')
+    if last_day == today:
+        return
     
-    conn.commit()
-    conn.close()
+    if last_day is not None:
+        run_write(rollover_users, st.session_state.user_profile['username'])
+        for med in st.session_state.medications:
+            med['taken_today'] = False
+            med['taken_time_slots'] = []
+        st.session_state.undo_stack = []
+        st.session_state.last_action = None
+        st.session_state.persisted_rows = snapshot_user_rows(st.session_state.user_profile, _session_entities())
+        invalidate_schedule_index()
+        bump_data_version()
+    st.session_state.rollover_date = today
 
 def clear_session_data():
     """Clear all session data (logout)"""
     st.session_state.user_profile = None
     st.session_state.medications = []
+    invalidate_schedule_index()
     st.session_state.appointments = []
     st.session_state.side_effects = []
     st.session_state.achievements = []
-    st.session_state.medication_history = []
-    st.session_state.adherence_history = []
     st.session_state.connected_patients = []
     st.session_state.turtle_mood = 'happy'
     st.session_state.signup_step = 1
@@ -828,6 +1597,8 @@ def clear_session_data():
     st.session_state.editing_medication = None
     st.session_state.undo_stack = []
     st.session_state.last_action = None
+    st.session_state.persisted_rows = None
+    st.session_state.rollover_date = None
 
 def push_undo_state(action_type, data):
     """Push state to undo stack"""
@@ -850,16 +1621,19 @@ def undo_last_action():
         med_id = last_action['data']['med_id']
         for med in st.session_state.medications:
             if med['id'] == med_id:
+                slots = last_action['data'].get('slots', [last_action['data'].get('time')])
+                med['taken_time_slots'] = [slot for slot in med.get('taken_time_slots', []) if slot not in slots]
                 med['taken_today'] = False
-                update_medication_history(med_id, 'untaken')
-                update_adherence_history()
+                update_medication_history(med_id, 'untaken', slots)
                 save_user_data()
+                update_adherence_history()
                 st.session_state.last_action = f"Undid taking {med['name']}"
                 return True
     
     elif last_action['action_type'] == 'medication_added':
         med_index = last_action['data']['med_index']
         st.session_state.medications.pop(med_index)
+        invalidate_schedule_index()
         save_user_data()
         st.session_state.last_action = "Undid adding medication"
         return True
@@ -867,6 +1641,7 @@ def undo_last_action():
     elif last_action['action_type'] == 'medication_deleted':
         deleted_med = last_action['data']['medication']
         st.session_state.medications.append(deleted_med)
+        invalidate_schedule_index()
         save_user_data()
         st.session_state.last_action = f"Restored {deleted_med['name']}"
         return True
@@ -900,8 +1675,9 @@ def show_undo_button():
                 else:
                     st.error("Nothing to undo")
 
+@st.cache_data
 def inject_custom_css(age_category='adult'):
-    """Inject custom CSS into Streamlit app with age-based styling"""
+    """Build the age-based CSS block, once per age category and with whitespace collapsed"""
     primary_color = get_primary_color(age_category)
     secondary_color = get_secondary_color(age_category)
     font_size = get_font_size(age_category)
@@ -1146,10 +1922,74 @@ def inject_custom_css(age_category='adult'):
     }}
     </style>
     """
-    return css
+    return " ".join(css.split())
+
+class FigureCache:
+    """Process-wide LRU of built figures, capped per session and in total"""
+    
+    def __init__(self, session_size=FIGURE_CACHE_SESSION_SIZE, max_size=FIGURE_CACHE_MAX_SIZE):
+        self.session_size = session_size
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._figures = OrderedDict()  # (session_id, fingerprint) -> figure, least recent first
+        self._sessions = {}  # session_id -> OrderedDict of that session's fingerprints
+    
+    def get(self, session_id, fingerprint):
+        with self._lock:
+            figure = self._figures.get((session_id, fingerprint))
+            if figure is not None:
+                self._figures.move_to_end((session_id, fingerprint))
+                self._sessions[session_id].move_to_end(fingerprint)
+            return figure
+    
+    def put(self, session_id, fingerprint, figure):
+        with self._lock:
+            self._figures[(session_id, fingerprint)] = figure
+            self._figures.move_to_end((session_id, fingerprint))
+            fingerprints = self._sessions.setdefault(session_id, OrderedDict())
+            fingerprints[fingerprint] = None
+            fingerprints.move_to_end(fingerprint)
+            
+            while len(fingerprints) > self.session_size:
+                oldest, _ = fingerprints.popitem(last=False)
+                del self._figures[(session_id, oldest)]
+            while len(self._figures) > self.max_size:
+                (oldest_session, oldest), _ = self._figures.popitem(last=False)
+                self._sessions[oldest_session].pop(oldest)
+                if not self._sessions[oldest_session]:
+                    del self._sessions[oldest_session]
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+def bump_data_version():
+    """Mark the session's data as changed so cached figures are rebuilt"""
+    st.session_state.data_version = st.session_state.get('data_version', 0) + 1
+
+def cached_figure(builder, data, *args, key=None):
+    """Get ``builder(data, *args)``, reusing the figure built for the same inputs.
+
+    The fingerprint is the builder, the session's data version, ``args``,
+    ``key`` and the length of ``data``. ``data`` may instead be a
+    zero-argument callable, which is only called on a cache miss; pass
+    whatever selects the data (e.g. a date range) as ``key`` then.
+    """
+    session_id = st.session_state.setdefault('figure_session_id', uuid.uuid4().hex)
+    fingerprint = (builder.__name__, st.session_state.get('data_version', 0), args, key,
+                   None if callable(data) else len(data))
+    cache = get_figure_cache()
+    figure = cache.get(session_id, fingerprint)
+    if figure is None:
+        figure = builder(data() if callable(data) else data, *args)
+        cache.put(session_id, fingerprint, figure)
+        logger.debug("Built figure %s", builder.__name__)
+    return figure
 
 def create_adherence_line_chart(adherence_history, age_category='adult'):
     """Create line chart showing adherence over time"""
+    import plotly.graph_objects as go
+    
     if not adherence_history:
         fig = go.Figure()
         fig.add_annotation(
@@ -1192,6 +2032,8 @@ def create_adherence_line_chart(adherence_history, age_category='adult'):
 
 def create_medication_pie_chart(medications, age_category='adult'):
     """Create pie chart showing medications by type"""
+    import plotly.graph_objects as go
+    
     if not medications:
         fig = go.Figure()
         fig.add_annotation(
@@ -1227,6 +2069,8 @@ def create_medication_pie_chart(medications, age_category='adult'):
 
 def create_daily_schedule_bar_chart(medications, age_category='adult'):
     """Create bar chart showing medication schedule throughout the day"""
+    import plotly.graph_objects as go
+    
     if not medications:
         fig = go.Figure()
         fig.add_annotation(
@@ -1272,6 +2116,8 @@ def create_daily_schedule_bar_chart(medications, age_category='adult'):
 
 def create_side_effects_bar_chart(side_effects):
     """Create bar chart showing side effects by severity"""
+    import plotly.graph_objects as go
+    
     if not side_effects:
         fig = go.Figure()
         fig.add_annotation(
@@ -1307,6 +2153,8 @@ def create_side_effects_bar_chart(side_effects):
 
 def create_medication_status_donut(medications):
     """Create donut chart showing taken vs pending medications"""
+    import plotly.graph_objects as go
+    
     if not medications:
         fig = go.Figure()
         fig.add_annotation(
@@ -1344,9 +2192,68 @@ def create_medication_status_donut(medications):
     )
     return fig
 
-def create_weekly_heatmap(medication_history):
-    """Create heatmap showing medication adherence by day and time"""
+def heatmap_bucket_count(bucket_hours):
+    return -(-24 // bucket_hours)
+
+# Net doses per history action: an undo cancels the dose it reverts
+DOSE_ACTION_WEIGHTS = {'taken': 1, 'untaken': -1}
+
+def bin_weekly_doses(medication_history, bucket_hours=HEATMAP_BUCKET_HOURS):
+    """Count doses per (weekday, time-of-day bucket) as a 7 x buckets array, Monday first"""
+    import numpy as np
+    import pandas as pd
+    
+    buckets = heatmap_bucket_count(bucket_hours)
     if not medication_history:
+        return np.zeros((7, buckets), dtype=int)
+    
+    history = pd.DataFrame(medication_history, columns=['timestamp', 'action'])
+    timestamps = pd.to_datetime(history['timestamp'], errors='coerce')
+    weights = history['action'].map(DOSE_ACTION_WEIGHTS).fillna(0).to_numpy(dtype=int)
+    valid = timestamps.notna().to_numpy()
+    cells = (timestamps.dt.weekday.to_numpy()[valid] * buckets
+             + timestamps.dt.hour.to_numpy()[valid] // bucket_hours).astype(int)
+    grid = np.bincount(cells, weights=weights[valid], minlength=7 * buckets)
+    return np.clip(grid, 0, None).astype(int).reshape(7, buckets)
+
+def fetch_weekly_dose_counts(username, start_date, end_date, bucket_hours=HEATMAP_BUCKET_HOURS):
+    """Same as ``bin_weekly_doses`` but binned by SQLite, for histories too large to load"""
+    import numpy as np
+    
+    grid = np.zeros((7, heatmap_bucket_count(bucket_hours)), dtype=int)
+    with get_db_connection() as conn:
+        rows = conn.execute('''SELECT (CAST(strftime('%w', timestamp) AS INTEGER) + 6) % 7 AS weekday,
+                                      CAST(strftime('%H', timestamp) AS INTEGER) / ? AS bucket,
+                                      SUM(CASE action WHEN 'taken' THEN 1 WHEN 'untaken' THEN -1 ELSE 0 END)
+                               FROM medication_history
+                               WHERE username = ? AND date BETWEEN ? AND ?
+                               GROUP BY weekday, bucket''',
+                            (bucket_hours, username, start_date, end_date)).fetchall()
+    for weekday, bucket, doses in rows:
+        if weekday is not None and bucket is not None:
+            grid[weekday, bucket] = max(doses, 0)
+    return grid
+
+def history_exceeds(username, start_date, end_date, threshold):
+    """Check whether more than ``threshold`` history rows fall between two dates, without counting them all"""
+    with get_db_connection() as conn:
+        row = conn.execute('''SELECT 1 FROM medication_history
+                               WHERE username = ? AND date BETWEEN ? AND ?
+                               LIMIT 1 OFFSET ?''',
+                           (username, start_date, end_date, threshold)).fetchone()
+    return row is not None
+
+def weekly_dose_grid(username, start_date, end_date, bucket_hours=HEATMAP_BUCKET_HOURS):
+    """Get the weekday x time-of-day dose counts, binning in pandas or SQL depending on history size"""
+    if history_exceeds(username, start_date, end_date, HEATMAP_SQL_THRESHOLD):
+        return fetch_weekly_dose_counts(username, start_date, end_date, bucket_hours)
+    return bin_weekly_doses(list(iter_medication_history(username, start_date, end_date)), bucket_hours)
+
+def create_weekly_heatmap(dose_grid, bucket_hours=HEATMAP_BUCKET_HOURS):
+    """Create heatmap showing doses taken by day and time"""
+    import plotly.graph_objects as go
+    
+    if dose_grid is None or not dose_grid.any():
         fig = go.Figure()
         fig.add_annotation(
             text="No medication history yet.<br>Start taking your medications to see patterns!",
@@ -1358,11 +2265,10 @@ def create_weekly_heatmap(medication_history):
         return fig
     
     days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    hours = [f"{h:02d}:00" for h in range(0, 24, 3)]
-    data = [[random.randint(0, 3) for _ in hours] for _ in days]
+    hours = [f"{h:02d}:00" for h in range(0, 24, bucket_hours)]
     
     fig = go.Figure(data=go.Heatmap(
-        z=data, x=hours, y=days,
+        z=dose_grid, x=hours, y=days,
         colorscale=[[0, '#f3f4f6'], [0.33, '#fef3c7'], [0.66, '#a7f3d0'], [1, '#10b981']],
         showscale=True, colorbar=dict(title='Medications<br>Taken'),
         hovertemplate='Day: %{y}<br>Time: %{x}<br>Medications: %{z}<extra></extra>'
@@ -1375,155 +2281,368 @@ def create_weekly_heatmap(medication_history):
     )
     return fig
 
-def generate_pdf_report(report_data, report_type="Complete Health Report"):
-    """Generate PDF report using ReportLab"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1f2937'),
-        alignment=TA_CENTER,
-        spaceAfter=30
-    )
+class ReportTemplate:
+    """Paragraph styles and per-section table layouts for PDF reports.
+
+    Building the styles costs more than laying out a small report, so one
+    read-only instance is shared by every report build in the process.
+    """
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=18,
-        textColor=colors.HexColor('#374151'),
-        spaceAfter=12,
-        spaceBefore=20
-    )
+    __slots__ = ('title', 'heading', 'normal', 'layouts')
     
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#4b5563'),
-        spaceAfter=8
-    )
+    # Section -> (header row, column widths in inches, header colour)
+    SECTIONS = {
+        'medications': (('Name', 'Dosage', 'Type', 'Frequency', 'Time', 'Status'), (2.5, 1, 1, 1.5, 1, 1), '#3B82F6'),
+        'appointments': (('Doctor', 'Specialty', 'Date', 'Time', 'Location'), (2, 1.5, 1.5, 1, 2), '#10B981'),
+        'side_effects': (('Medication', 'Severity', 'Type', 'Date', 'Description'), (2, 1, 1.5, 1, 2), '#EF4444'),
+        'adherence_history': (('Date', 'Adherence', 'Last Updated'), (2, 2, 2), '#8B5CF6'),
+        'medication_history': (('Date', 'Time', 'Medication', 'Action'), (1.5, 1, 3, 1.5), '#F59E0B'),
+    }
     
-    story.append(Paragraph("MEDTIMER HEALTH REPORT", title_style))
-    story.append(Spacer(1, 20))
+    def __init__(self):
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.platypus import TableStyle
+        from reportlab.lib.enums import TA_CENTER
+        
+        styles = getSampleStyleSheet()
+        init = super().__setattr__
+        init('title', ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1f2937'),
+            alignment=TA_CENTER,
+            spaceAfter=30
+        ))
+        init('heading', ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=18,
+            textColor=colors.HexColor('#374151'),
+            spaceAfter=12,
+            spaceBefore=20
+        ))
+        init('normal', ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor('#4b5563'),
+            spaceAfter=8
+        ))
+        
+        layouts = {}
+        for section, (header, widths, color) in self.SECTIONS.items():
+            layouts[section] = (header, tuple(width * inch for width in widths), TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(color)),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ]))
+        init('layouts', types.MappingProxyType(layouts))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("ReportTemplate is read-only")
+    
+    def tables(self, section, rows, chunk_rows=REPORT_TABLE_ROWS):
+        """Yield styled tables of at most ``chunk_rows`` of ``rows`` each, built only as they are needed.
+
+        Every chunk starts with the header row, which is also repeated if
+        the chunk itself splits across a page.
+        """
+        from reportlab.platypus import Table
+        
+        header, widths, style = self.layouts[section]
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                return
+            table = Table([list(header)] + chunk, colWidths=widths, repeatRows=1)
+            table.setStyle(style)
+            yield table
+
+@st.cache_resource
+def get_report_template():
+    return ReportTemplate()
+
+class StreamingStory(list):
+    """A ``doc.build`` story that is refilled from a flowable iterator as it is laid out.
+
+    ReportLab checks ``len(story)`` before laying out each flowable and then
+    deletes it from the front, so only ``lookahead`` flowables (plus the
+    remainders of split ones) are held at any time.
+    """
     
-    profile = report_data.get('profile', {})
-    story.append(Paragraph(f"<b>Patient:</b> {profile.get('name', 'N/A')}", normal_style))
-    story.append(Paragraph(f"<b>Age:</b> {profile.get('age', 'N/A')}", normal_style))
-    story.append(Paragraph(f"<b>Report Type:</b> {report_type}", normal_style))
-    story.append(Paragraph(f"<b>Generated:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-    story.append(Spacer(1, 20))
-    story.append(Paragraph("=" * 70, normal_style))
-    story.append(Spacer(1, 20))
+    def __init__(self, flowables, lookahead=REPORT_STORY_LOOKAHEAD):
+        super().__init__()
+        self.lookahead = lookahead
+        self.pulled = 0
+        self._flowables = iter(flowables)
+        self._exhausted = False
+    
+    def __len__(self):
+        while not self._exhausted and super().__len__() < self.lookahead:
+            flowable = next(self._flowables, None)
+            if flowable is None:
+                self._exhausted = True
+            else:
+                self.append(flowable)
+                self.pulled += 1
+        return super().__len__()
     
-    medications = report_data.get('medications', [])
-    story.append(Paragraph(f"💊 MEDICATIONS ({len(medications)})", heading_style))
-    story.append(Spacer(1, 10))
-    
-    if medications:
-        med_data = [['Name', 'Dosage', 'Type', 'Frequency', 'Time', 'Status']]
-        for med in medications:
-            status = "Taken" if med.get('taken_today', False) else "Pending"
-            med_data.append([
-                med.get('name', 'N/A'),
-                med.get('dosageAmount', 'N/A'),
-                med.get('dosageType', 'N/A').capitalize(),
-                med.get('frequency', 'N/A').replace('-', ' ').title(),
-                med.get('time', 'N/A'),
-                status
-            ])
-        
-        med_table = Table(med_data, colWidths=[2.5*inch, 1*inch, 1*inch, 1.5*inch, 1*inch, 1*inch])
-        med_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        story.append(med_table)
+    def laid_out(self):
+        """Count the flowables already taken off the story"""
+        return self.pulled - super().__len__()
+
+def pdf_section(template, heading, section, rows, empty):
+    """Yield a report section: its heading, then its chunked table or the ``empty`` note"""
+    from reportlab.platypus import Paragraph, Spacer
+    
+    yield Paragraph(heading, template.heading)
+    yield Spacer(1, 10)
+    tables = template.tables(section, rows)
+    first = next(tables, None)
+    if first is None:
+        yield Paragraph(empty, template.normal)
     else:
-        story.append(Paragraph("No medications recorded.", normal_style))
+        yield first
+        yield from tables
+    yield Spacer(1, 20)
+
+def iter_report_story(report_data, report_type, template):
+    """Yield the flowables of a PDF report in order, building each table chunk on demand.
+
+    ``medication_history`` may be any iterable, e.g. rows streamed from
+    SQLite; the other sections are lists.
+    """
+    from reportlab.platypus import Paragraph, Spacer, PageBreak
     
-    story.append(Spacer(1, 20))
+    normal_style = template.normal
+    yield Paragraph("MEDTIMER HEALTH REPORT", template.title)
+    yield Spacer(1, 20)
     
-    appointments = report_data.get('appointments', [])
-    story.append(Paragraph(f"👨‍⚕️ APPOINTMENTS ({len(appointments)})", heading_style))
-    story.append(Spacer(1, 10))
-    
-    if appointments:
-        appt_data = [['Doctor', 'Specialty', 'Date', 'Time', 'Location']]
-        for appt in appointments:
-            appt_data.append([
-                appt.get('doctor', 'N/A'),
-                appt.get('specialty', 'N/A'),
-                appt.get('date', 'N/A'),
-                appt.get('time', 'N/A'),
-                appt.get('location', 'N/A')
-            ])
-        
-        appt_table = Table(appt_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1*inch, 2*inch])
-        appt_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        story.append(appt_table)
-    else:
-        story.append(Paragraph("No appointments scheduled.", normal_style))
+    profile = report_data.get('profile', {})
+    yield Paragraph(f"<b>Patient:</b> {profile.get('name', 'N/A')}", normal_style)
+    yield Paragraph(f"<b>Age:</b> {profile.get('age', 'N/A')}", normal_style)
+    yield Paragraph(f"<b>Report Type:</b> {report_type}", normal_style)
+    if report_data.get('start_date'):
+        yield Paragraph(f"<b>Date Range:</b> {report_data['start_date']} to {report_data.get('end_date')}", normal_style)
+    yield Paragraph(f"<b>Generated:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style)
+    yield Spacer(1, 20)
+    yield Paragraph("=" * 70, normal_style)
+    yield Spacer(1, 20)
     
-    story.append(Spacer(1, 20))
+    medications = report_data.get('medications', [])
+    yield from pdf_section(template, f"💊 MEDICATIONS ({len(medications)})", 'medications', ([
+        med.get('name', 'N/A'),
+        med.get('dosageAmount', 'N/A'),
+        med.get('dosageType', 'N/A').capitalize(),
+        med.get('frequency', 'N/A').replace('-', ' ').title(),
+        med.get('time', 'N/A'),
+        "Taken" if med.get('taken_today', False) else "Pending"
+    ] for med in medications), "No medications recorded.")
+    
+    appointments = report_data.get('appointments', [])
+    yield from pdf_section(template, f"👨‍⚕️ APPOINTMENTS ({len(appointments)})", 'appointments', ([
+        appt.get('doctor', 'N/A'),
+        appt.get('specialty', 'N/A'),
+        appt.get('date', 'N/A'),
+        appt.get('time', 'N/A'),
+        appt.get('location', 'N/A')
+    ] for appt in appointments), "No appointments scheduled.")
     
     side_effects = report_data.get('side_effects', [])
-    story.append(Paragraph(f"⚠️ SIDE EFFECTS ({len(side_effects)})", heading_style))
-    story.append(Spacer(1, 10))
-    
-    if side_effects:
-        effect_data = [['Medication', 'Severity', 'Type', 'Date', 'Description']]
-        for effect in side_effects:
-            effect_data.append([
-                effect.get('medication', 'N/A'),
-                effect.get('severity', 'N/A'),
-                effect.get('type', 'N/A'),
-                effect.get('date', 'N/A'),
-                effect.get('description', 'N/A')[:50] + '...' if len(effect.get('description', '')) > 50 else effect.get('description', 'N/A')
-            ])
-        
-        effect_table = Table(effect_data, colWidths=[2*inch, 1*inch, 1.5*inch, 1*inch, 2*inch])
-        effect_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#EF4444')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        story.append(effect_table)
-    else:
-        story.append(Paragraph("No side effects reported.", normal_style))
+    yield from pdf_section(template, f"⚠️ SIDE EFFECTS ({len(side_effects)})", 'side_effects', ([
+        effect.get('medication', 'N/A'),
+        effect.get('severity', 'N/A'),
+        effect.get('type', 'N/A'),
+        effect.get('date', 'N/A'),
+        effect.get('description', 'N/A')[:50] + '...' if len(effect.get('description', '')) > 50 else effect.get('description', 'N/A')
+    ] for effect in side_effects), "No side effects reported.")
+    
+    adherence_history = report_data.get('adherence_history', [])
+    yield from pdf_section(template, f"📈 DAILY ADHERENCE ({len(adherence_history)} days)", 'adherence_history', ([
+        day['date'],
+        f"{day['adherence']:.0f}%",
+        day.get('updated') or ''
+    ] for day in adherence_history), "No adherence recorded in this period.")
+    
+    yield from pdf_section(template, "📋 MEDICATION HISTORY", 'medication_history', ([
+        event['date'],
+        (event.get('timestamp') or '')[11:16],
+        event.get('name', f"#{event['medication_id']}"),
+        event['action'].capitalize()
+    ] for event in report_data.get('medication_history', [])), "No doses recorded in this period.")
+    
+    yield PageBreak()
+    yield Paragraph("Generated by MedTimer - Your Medication Management Companion", normal_style)
+    yield Paragraph("=" * 70, normal_style)
+
+def report_story_size(report_data):
+    """Estimate how many flowables a report's story holds, for progress reporting.
+
+    Streamed sections have no length; their row count is read from
+    ``<section>_count`` instead.
+    """
+    # The fixed paragraphs and spacers, plus a table chunk or empty note per section
+    size = 15 + 4 * len(ReportTemplate.SECTIONS)
+    for section in ReportTemplate.SECTIONS:
+        rows = report_data.get(section, [])
+        count = len(rows) if hasattr(rows, '__len__') else report_data.get(f'{section}_count', 0)
+        size += max(-(-count // REPORT_TABLE_ROWS) - 1, 0)
+    return size
+
+def generate_pdf_report(report_data, report_type="Complete Health Report", progress=None, template=None):
+    """Generate PDF report using ReportLab; ``progress`` is called with the fraction laid out so far.
+
+    ``template`` defaults to the process-wide one; pass it in when building
+    off the script thread.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
     
-    story.append(PageBreak())
-    story.append(Paragraph("Generated by MedTimer - Your Medication Management Companion", normal_style))
-    story.append(Paragraph("=" * 70, normal_style))
+    template = template or get_report_template()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = StreamingStory(iter_report_story(report_data, report_type, template))
+    if progress:
+        size = report_story_size(report_data)
+        
+        def on_layout(event, value):
+            if event == 'PROGRESS':
+                progress(min(story.laid_out() / size, 1.0))
+        
+        doc.setProgressCallBack(on_layout)
     
     doc.build(story)
     buffer.seek(0)
     return buffer.getvalue()
 
+class ReportJob:
+    """One background report build; ``progress`` runs from 0.0 to 1.0"""
+    
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.progress = 0.0
+        self.future = Future()
+    
+    def done(self):
+        return self.future.done()
+
+class ReportJobManager:
+    """Builds reports on a worker pool and keeps the most recent results by cache key.
+
+    Submitting a key whose report is cached returns an already finished job,
+    and submitting one that is being built returns the running job, so
+    re-downloads are instant and identical requests are built once.
+    """
+    
+    def __init__(self, workers=REPORT_WORKERS, cache_size=REPORT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='medtimer-report')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job id -> ReportJob, oldest first
+        self._running = {}  # cache key -> ReportJob being built
+        self._results = OrderedDict()  # cache key -> report bytes, least recent first
+    
+    def submit(self, key, build, *args):
+        """Get a job for ``build(*args, progress=...)``, starting it only if needed"""
+        with self._lock:
+            job = self._running.get(key)
+            if job is None:
+                job = ReportJob(key)
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    job.progress = 1.0
+                    job.future.set_result(self._results[key])
+                else:
+                    self._running[key] = job
+                    self._executor.submit(self._build, job, build, args)
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            self._trim_jobs()
+            return job
+    
+    def _trim_jobs(self):
+        """Forget the oldest finished jobs beyond ``cache_size``; running jobs are always kept"""
+        excess = len(self._jobs) - self.cache_size
+        if excess > 0:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.done()][:excess]:
+                del self._jobs[job_id]
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def _build(self, job, build, args):
+        def progress(fraction):
+            job.progress = fraction
+        
+        try:
+            result = build(*args, progress=progress)
+        except Exception as e:
+            logger.exception("Report job %s failed", job.id)
+            with self._lock:
+                self._running.pop(job.key, None)
+            job.future.set_exception(e)
+            return
+        
+        job.progress = 1.0
+        job.future.set_result(result)
+        with self._lock:
+            self._running.pop(job.key, None)
+            self._results[job.key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+            self._trim_jobs()
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def get_report_jobs():
+    manager = ReportJobManager()
+    atexit.register(manager.shutdown)
+    return manager
+
+@st.fragment(run_every=0.5)
+def report_job_progress(job_id):
+    """Poll a running report job, then rerun the page once it has finished"""
+    job = get_report_jobs().get(job_id)
+    if job is None or job.done():
+        st.rerun()
+    st.progress(job.progress, text=f"Building PDF report... {job.progress:.0%}")
+
+def show_report_job():
+    """Show progress or the download for the session's latest PDF report job"""
+    request = st.session_state.get('report_job')
+    if not request:
+        return
+    
+    job = get_report_jobs().get(request['job_id'])
+    if job is None:
+        st.warning("This report is no longer available. Please generate it again.")
+    elif not job.done():
+        report_job_progress(job.id)
+    elif job.future.exception() is not None:
+        st.error(f"Error generating report: {job.future.exception()}")
+    else:
+        st.success("PDF report generated successfully!")
+        st.download_button(
+            label="⬇️ Download PDF Report",
+            data=job.future.result(),
+            file_name=request['file_name'],
+            mime="application/pdf",
+            use_container_width=True
+        )
+
 def account_type_selection_page():
     """Landing page for selecting account type"""
     st.markdown("<h1 style='text-align: center; margin-top: 50px; color: white;'>🏥 Welcome to MedTimer</h1>", unsafe_allow_html=True)
@@ -1797,7 +2916,7 @@ def patient_signup_page():
             if st.button("➕ Add Medication"):
                 if med_name and dosage_amount:
                     med_data = {
-                        'id': len(st.session_state.signup_data['medications']) + 1,
+                        'id': next_entity_id(st.session_state.signup_data['medications']),
                         'name': med_name,
                         'dosageType': dosage_type.lower(),
                         'dosageAmount': dosage_amount,
@@ -1855,10 +2974,13 @@ def patient_signup_page():
                     'email': st.session_state.signup_data.get('email', ''),
                     'password': st.session_state.signup_data.get('password'),
                     'userType': 'patient',
+                    'timezone': browser_timezone(),
                     'diseases': st.session_state.signup_data.get('diseases', []),
                 }
                 
                 st.session_state.medications = st.session_state.signup_data.get('medications', [])
+                invalidate_schedule_index()
+                st.session_state.persisted_rows = None
                 save_user_data()
                 
                 st.session_state.signup_step = 1
@@ -1918,8 +3040,10 @@ def caregiver_signup_page():
                         'notes': notes,
                         'userType': 'caregiver',
                         'age': 30,
+                        'timezone': browser_timezone(),
                         'diseases': [],
                     }
+                    st.session_state.persisted_rows = None
                     save_user_data()
                     st.success("Registration complete!")
                     st.session_state.page = 'caregiver_dashboard'
@@ -1938,9 +3062,17 @@ def get_mascot_text_color(mood):
     }
     return colors.get(mood, '#374151')
 
+def rerun_fragment():
+    """Rerun only the calling fragment, or the whole app when this is not a fragment rerun"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+@st.fragment(run_every=1)
 def display_datetime_header():
-    """Display real-time date and time header - FIXED VERSION WITHOUT AUTO-REFRESH"""
-    now = datetime.now()
+    """Display the live date and time header; only this fragment reruns each second"""
+    now = user_now()
     current_time = now.strftime("%I:%M:%S %p")
     current_date = now.strftime("%A, %B %d, %Y")
     
@@ -1950,8 +3082,6 @@ def display_datetime_header():
         <p>{current_date}</p>
     </div>
     """, unsafe_allow_html=True)
-    
-    # REMOVED: time.sleep(0.1) and st.rerun() - This was causing the infinite loop
 
 def dashboard_overview_tab(age_category):
     """Dashboard overview with stats and today's schedule"""
@@ -1960,6 +3090,11 @@ def dashboard_overview_tab(age_category):
     # Display real-time date/time
     display_datetime_header()
     
+    dose_overview(age_category)
+
+@st.fragment
+def dose_overview(age_category):
+    """Stat cards, reminders and today's schedule; dose buttons rerun only this fragment"""
     missed, upcoming, taken = categorize_medications_by_status()
     
     col1, col2, col3, col4 = st.columns(4)
@@ -2028,7 +3163,7 @@ def dashboard_overview_tab(age_category):
     with col_sound_right:
         if st.button("🔊" if st.session_state.sound_enabled else "🔇", use_container_width=True):
             st.session_state.sound_enabled = not st.session_state.sound_enabled
-            st.rerun()
+            rerun_fragment()
 
     st.markdown("<h3 style='color: #ffffff;'>  🕐 Today's Medication Schedule</h3>", unsafe_allow_html=True)
     
@@ -2038,28 +3173,9 @@ def dashboard_overview_tab(age_category):
         if st.session_state.sound_enabled:
             play_reminder_sound()
         
-        for med in due_meds:
-            # Find the due time for this medication
-            med_time = med.get('time', '00:00')
+        for med, med_time in due_meds:
             due_time_display = format_time(med_time)
             
-            # Check if any reminder time is due
-            if med.get('reminder_times'):
-                taken_time_slots = med.get('taken_time_slots', [])
-                now = datetime.now()
-                current_time = now.strftime("%H:%M")
-                
-                for reminder_time in med['reminder_times']:
-                    if reminder_time not in taken_time_slots:
-                        reminder_datetime = datetime.strptime(reminder_time, "%H:%M").replace(
-                            year=now.year, month=now.month, day=now.day
-                        )
-                        time_diff = abs((now - reminder_datetime).total_seconds() / 60)
-                        if time_diff <= 5:
-                            med_time = reminder_time
-                            due_time_display = format_time(reminder_time)
-                            break
-            
             st.markdown(f"""
             <div class='reminder-item'>
                 <strong>🔔 REMINDER NOW:</strong> {med['name']} ({med['dosageAmount']}) at {due_time_display}
@@ -2091,11 +3207,11 @@ def dashboard_overview_tab(age_category):
                         
                         m['taken_today'] = all_slots_taken
                         
-                        update_medication_history(m['id'], 'taken')
-                        update_adherence_history()
+                        update_medication_history(m['id'], 'taken', [med_time])
                         push_undo_state('medication_taken', {'med_id': med['id'], 'med_name': med['name'], 'time': med_time})
                         save_user_data()
-                        st.rerun()
+                        update_adherence_history()
+                        rerun_fragment()
     else:
         st.info("No medications due right now.")
     
@@ -2103,15 +3219,17 @@ def dashboard_overview_tab(age_category):
     st.markdown("<h4 style='color: #ffffff;'> # 📅 Upcoming Reminders (Next 30 minutes)</h4>", unsafe_allow_html=True)
     
     upcoming_count = 0
+    now_minute = current_minute()
     for med in upcoming[:5]:
-        med_time = datetime.strptime(med['time'], "%H:%M")
-        now = datetime.now()
-        time_diff = (med_time - now).total_seconds() / 60
+        minute = slot_minute(med['time'])
+        if minute is None:
+            continue
+        time_diff = minute - now_minute
         
         if 0 < time_diff <= 30:
             st.markdown(f"""
             <div class='reminder-item' style='border-left-color: #3b82f6;'>
-                <strong>⏰ In {int(time_diff)} minutes:</strong> {med['name']} ({med['dosageAmount']}) at {format_time(med['time'])}
+                <strong>⏰ In {time_diff} minutes:</strong> {med['name']} ({med['dosageAmount']}) at {format_time(med['time'])}
             </div>
             """, unsafe_allow_html=True)
             upcoming_count += 1
@@ -2127,10 +3245,12 @@ def dashboard_overview_tab(age_category):
     col1, col2 = st.columns(2)
     
     with col1:
-        st.plotly_chart(create_medication_status_donut(st.session_state.medications), use_container_width=True)
+        st.plotly_chart(cached_figure(create_medication_status_donut, st.session_state.medications),
+                        use_container_width=True)
     
     with col2:
-        st.plotly_chart(create_medication_pie_chart(st.session_state.medications, age_category), use_container_width=True)
+        st.plotly_chart(cached_figure(create_medication_pie_chart, st.session_state.medications, age_category),
+                        use_container_width=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -2185,11 +3305,11 @@ def dashboard_overview_tab(age_category):
                                 
                                 m['taken_today'] = all_slots_taken
                                 
-                                update_medication_history(m['id'], 'taken')
+                                update_medication_history(m['id'], 'taken', [missed_time])
                                 push_undo_state('medication_taken', {'med_id': med['id'], 'med_name': med['name'], 'time': missed_time})
-                        update_adherence_history()
                         save_user_data()
-                        st.rerun()
+                        update_adherence_history()
+                        rerun_fragment()
                 st.markdown("", unsafe_allow_html=True)
         
         if upcoming:
@@ -2242,12 +3362,12 @@ def dashboard_overview_tab(age_category):
                                 
                                 m['taken_today'] = all_slots_taken
                                 
-                                update_medication_history(m['id'], 'taken')
+                                update_medication_history(m['id'], 'taken', [upcoming_time])
                                 play_notification_sound()
                                 push_undo_state('medication_taken', {'med_id': med['id'], 'med_name': med['name'], 'time': upcoming_time})
-                        update_adherence_history()
                         save_user_data()
-                        st.rerun()
+                        update_adherence_history()
+                        rerun_fragment()
                 st.markdown("", unsafe_allow_html=True)
         
         if taken:
@@ -2271,9 +3391,14 @@ def analytics_tab(age_category):
     """Analytics tab with comprehensive graphs"""
     st.markdown("<h3 style='color: #ffffff;'>📊 Medication Analytics & Insights</h3>", unsafe_allow_html=True)
     
+    window = st.selectbox("History Window", list(HISTORY_WINDOWS), key="analytics_window")
+    username = st.session_state.user_profile['username']
+    start_date, end_date = history_window(HISTORY_WINDOWS[window])
+    
     st.markdown("<h4 style='color: #ffffff;'> # Adherence Trend</h4>", unsafe_allow_html=True)
     st.plotly_chart(
-        create_adherence_line_chart(st.session_state.get('adherence_history', []), age_category),
+        cached_figure(create_adherence_line_chart, lambda: fetch_adherence_history(username, start_date, end_date),
+                      age_category, key=(username, start_date, end_date)),
         use_container_width=True
     )
     
@@ -2282,15 +3407,24 @@ def analytics_tab(age_category):
     col1, col2 = st.columns(2)
     
     with col1:
-        st.plotly_chart(create_daily_schedule_bar_chart(st.session_state.medications, age_category), use_container_width=True)
+        st.plotly_chart(cached_figure(create_daily_schedule_bar_chart, st.session_state.medications, age_category),
+                        use_container_width=True)
     
     with col2:
-        st.plotly_chart(create_side_effects_bar_chart(st.session_state.side_effects), use_container_width=True)
+        st.plotly_chart(cached_figure(create_side_effects_bar_chart, st.session_state.side_effects),
+                        use_container_width=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     st.markdown("<h4 style='color: #ffffff;'> # Weekly Medication Pattern</h4>", unsafe_allow_html=True)
-    st.plotly_chart(create_weekly_heatmap(st.session_state.get('medication_history', [])), use_container_width=True)
+    bucket_hours = st.select_slider("Hours per time slot", HEATMAP_BUCKET_CHOICES,
+                                    value=HEATMAP_BUCKET_HOURS, key="heatmap_bucket_hours")
+    st.plotly_chart(
+        cached_figure(create_weekly_heatmap,
+                      lambda: weekly_dose_grid(username, start_date, end_date, bucket_hours),
+                      bucket_hours, key=(username, start_date, end_date)),
+        use_container_width=True
+    )
 
 def medications_tab():
     """Medications tab content"""
@@ -2361,7 +3495,10 @@ def medications_tab():
                             med['instructions'] = edit_instructions
                             if len(reminder_times_input) > 1:
                                 med['reminder_times'] = reminder_times_input
+                            else:
+                                med.pop('reminder_times', None)
                             break
+                    invalidate_schedule_index()
                     
                     save_user_data()
                     st.session_state.editing_medication = None
@@ -2415,7 +3552,7 @@ def medications_tab():
         if st.button("Add Medication", use_container_width=True, key="add_med_btn"):
             if new_med_name and new_dosage_amount:
                 new_med = {
-                    'id': len(st.session_state.medications) + 1,
+                    'id': next_entity_id(st.session_state.medications),
                     'name': new_med_name,
                     'dosageType': new_dosage_type,
                     'dosageAmount': new_dosage_amount,
@@ -2435,6 +3572,7 @@ def medications_tab():
                     st.warning(f"⚠️ Time conflict detected with: {', '.join(conflicts)}. Medications are scheduled close together.")
                 
                 st.session_state.medications.append(new_med)
+                invalidate_schedule_index()
                 push_undo_state('medication_added', {'med_index': len(st.session_state.medications) - 1, 'med_name': new_med_name})
                 save_user_data()
                 st.success(f"Added {new_med_name}!")
@@ -2502,6 +3640,7 @@ def medications_tab():
                 if st.button("🗑️", key=f"delete_{med['id']}", help="Delete"):
                     push_undo_state('medication_deleted', {'medication': med.copy()})
                     st.session_state.medications = [m for m in st.session_state.medications if m['id'] != med['id']]
+                    invalidate_schedule_index()
                     save_user_data()
                     st.rerun()
                 
@@ -2511,25 +3650,24 @@ def medications_tab():
                         if 'taken_time_slots' not in med:
                             med['taken_time_slots'] = []
                         
-                        # Mark the main time as taken
+                        # Mark the main time and all reminder times as taken (user is taking the medication);
+                        # only the slots this click adds are recorded, so undo leaves earlier doses alone
                         med_time = med.get('time', '00:00')
-                        if med_time not in med['taken_time_slots']:
-                            med['taken_time_slots'].append(med_time)
-                        
-                        # Mark all reminder times as taken as well (user is taking the medication)
-                        if med.get('reminder_times'):
-                            for slot in med['reminder_times']:
-                                if slot not in med['taken_time_slots']:
-                                    med['taken_time_slots'].append(slot)
+                        newly_taken = []
+                        for slot in [med_time] + med.get('reminder_times', []):
+                            if slot not in med['taken_time_slots'] and slot not in newly_taken:
+                                newly_taken.append(slot)
+                        med['taken_time_slots'].extend(newly_taken)
                         
                         # Mark medication as taken
                         med['taken_today'] = True
                         
                         play_notification_sound()
-                        update_medication_history(med['id'], 'taken')
-                        update_adherence_history()
-                        push_undo_state('medication_taken', {'med_id': med['id'], 'med_name': med['name'], 'time': med_time})
+                        update_medication_history(med['id'], 'taken', newly_taken)
+                        push_undo_state('medication_taken', {'med_id': med['id'], 'med_name': med['name'], 'time': med_time,
+                                                             'slots': newly_taken})
                         save_user_data()
+                        update_adherence_history()
                         st.rerun()
             
             st.markdown("</div>", unsafe_allow_html=True)
@@ -2547,7 +3685,7 @@ def appointments_tab():
         with col1:
             appt_doctor = st.text_input("Doctor Name", key="appt_doctor")
             appt_specialty = st.text_input("Specialty", key="appt_specialty", placeholder="e.g., Cardiologist")
-            appt_date = st.date_input("Date", key="appt_date", min_value=date.today())
+            appt_date = st.date_input("Date", key="appt_date", min_value=user_now().date())
         
         with col2:
             appt_time = st.time_input("Time", key="appt_time")
@@ -2559,7 +3697,7 @@ def appointments_tab():
         if st.button("Schedule Appointment", use_container_width=True, key="add_appt_btn"):
             if appt_doctor and appt_date:
                 new_appt = {
-                    'id': len(st.session_state.appointments) + 1,
+                    'id': next_entity_id(st.session_state.appointments),
                     'doctor': appt_doctor,
                     'specialty': appt_specialty,
                     'date': appt_date.strftime("%Y-%m-%d"),
@@ -2582,7 +3720,7 @@ def appointments_tab():
     
     filter_option = st.selectbox("Filter", ["All Appointments", "Upcoming", "Past"], key="filter_appointments")
     
-    today = date.today().strftime("%Y-%m-%d")
+    today = user_now().strftime("%Y-%m-%d")
     filtered_appts = st.session_state.appointments.copy()
     
     if filter_option == "Upcoming":
@@ -2682,7 +3820,7 @@ def side_effects_tab():
             if st.button("Report Side Effect", use_container_width=True, key="report_effect_btn"):
                 if effect_description:
                     new_effect = {
-                        'id': len(st.session_state.side_effects) + 1,
+                        'id': next_entity_id(st.session_state.side_effects),
                         'medication': effect_med,
                         'severity': effect_severity,
                         'type': effect_type,
@@ -2856,6 +3994,195 @@ def achievements_tab():
             </div>
             """, unsafe_allow_html=True)
 
+# Report section key -> heading, in the order sections are written
+REPORT_SECTIONS = {
+    'medications': "MEDICATIONS",
+    'appointments': "APPOINTMENTS",
+    'side_effects': "SIDE EFFECTS LOG",
+    'adherence': "DAILY ADHERENCE",
+    'doses': "DOSE HISTORY",
+}
+REPORT_CSV_COLUMNS = ['record', 'date', 'time', 'name', 'dosage', 'type', 'status', 'details']
+
+def _iter_query(sql, params):
+    """Yield the rows of a query as dicts, straight off the cursor"""
+    with get_db_connection() as conn:
+        cursor = conn.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        for row in cursor:
+            yield dict(zip(columns, row))
+
+def iter_dose_history(username, start_date, end_date):
+    """Yield medication history rows between two dates with each medication's name added"""
+    with get_db_connection() as conn:
+        names = dict(conn.execute('SELECT id, name FROM medications WHERE username = ?', (username,)))
+    for event in iter_medication_history(username, start_date, end_date):
+        yield {**event, 'name': names.get(event['medication_id'], f"#{event['medication_id']}")}
+
+def iter_report_sections(username, start_date, end_date, detailed=False):
+    """Yield (section, rows) pairs for a report; each ``rows`` streams from SQLite.
+
+    Appointments, side effects and history are limited to the date range and
+    medications to those created by its end. The dose history is only
+    included in detailed reports.
+    """
+    yield 'medications', _iter_query('''SELECT name, dosage_amount, dosage_type, frequency, time, taken_today
+                                        FROM medications
+                                        WHERE username = ? AND COALESCE(substr(created_at, 1, 10), '') <= ?
+                                        ORDER BY id''', (username, end_date))
+    yield 'appointments', _iter_query('''SELECT doctor, specialty, date, time, location FROM appointments
+                                         WHERE username = ? AND date BETWEEN ? AND ?
+                                         ORDER BY date, time''', (username, start_date, end_date))
+    yield 'side_effects', _iter_query('''SELECT medication, severity, type, date, description FROM side_effects
+                                         WHERE username = ? AND date BETWEEN ? AND ?
+                                         ORDER BY date''', (username, start_date, end_date))
+    yield 'adherence', _iter_query('''SELECT date, adherence FROM adherence_history
+                                      WHERE username = ? AND date BETWEEN ? AND ?
+                                      ORDER BY date''', (username, start_date, end_date))
+    if detailed:
+        yield 'doses', iter_dose_history(username, start_date, end_date)
+
+def format_report_text(section, number, row):
+    """Format one report row as a block of the text report"""
+    if section == 'medications':
+        status = "✅ Taken" if row['taken_today'] else "⏰ Pending"
+        return f"""
+{number}. {row['name']}
+   - Dosage: {row['dosage_amount']}
+   - Type: {(row['dosage_type'] or '').capitalize()}
+   - Frequency: {(row['frequency'] or '').replace('-', ' ').title()}
+   - Time: {row['time']}
+   - Status: {status}
+"""
+    if section == 'appointments':
+        return f"""
+{number}. Dr. {row['doctor']}
+   - Specialty: {row['specialty'] or 'N/A'}
+   - Date: {row['date']}
+   - Time: {row['time']}
+   - Location: {row['location'] or 'N/A'}
+"""
+    if section == 'side_effects':
+        return f"""
+{number}. {row['medication']} - {row['severity']}
+   - Type: {row['type'] or 'N/A'}
+   - Date: {row['date']}
+   - Description: {row['description']}
+"""
+    if section == 'adherence':
+        return f"{row['date']}: {row['adherence']:.0f}%\n"
+    return f"{row['timestamp']}  {row['name']}  {row['action']}\n"
+
+def report_csv_row(section, row):
+    """Map one report row onto REPORT_CSV_COLUMNS"""
+    if section == 'medications':
+        return ['medication', '', row['time'], row['name'], row['dosage_amount'], row['dosage_type'],
+                "Taken" if row['taken_today'] else "Pending", row['frequency']]
+    if section == 'appointments':
+        return ['appointment', row['date'], row['time'], f"Dr. {row['doctor']}", '', row['specialty'], '',
+                row['location']]
+    if section == 'side_effects':
+        return ['side_effect', row['date'], '', row['medication'], '', row['type'], row['severity'],
+                row['description']]
+    if section == 'adherence':
+        return ['adherence', row['date'], '', '', '', '', f"{row['adherence']:.0f}%", '']
+    return ['dose', row['date'], row['timestamp'][11:16], row['name'], '', '', row['action'], '']
+
+def write_text_report(out, header, sections):
+    """Write a text report section by section without holding more than one row"""
+    out.write(header)
+    for section, rows in sections:
+        out.write(f"\n{REPORT_SECTIONS[section]}\n{'-' * 70}\n")
+        count = 0
+        for count, row in enumerate(rows, 1):
+            out.write(format_report_text(section, count, row))
+        out.write(f"\nTotal: {count}\n" if count else "\nNone recorded.\n")
+    out.write(f"""
+{'=' * 70}
+End of Report
+Generated by MedTimer - Your Medication Management Companion
+{'=' * 70}
+""")
+
+def write_csv_report(out, sections):
+    """Write every report row as one CSV record"""
+    writer = csv.writer(out)
+    writer.writerow(REPORT_CSV_COLUMNS)
+    for section, rows in sections:
+        writer.writerows(report_csv_row(section, row) for row in rows)
+
+def build_report_file(profile, report_type, start_date, end_date, report_format):
+    """Stream a Text, Detailed or CSV report into a spooled file, rewound for reading"""
+    spool = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_SIZE)
+    out = io.TextIOWrapper(spool, encoding='utf-8', newline='' if report_format == "CSV" else None)
+    sections = iter_report_sections(profile['username'], start_date, end_date,
+                                    detailed=report_format == "Detailed")
+    if report_format == "CSV":
+        write_csv_report(out, sections)
+    else:
+        write_text_report(out, f"""{'=' * 70}
+MEDTIMER HEALTH REPORT
+{'=' * 70}
+
+Patient: {profile['name']}
+Username: {profile['username']}
+Age: {profile['age']}
+Report Type: {report_type}
+Date Range: {start_date} to {end_date}
+Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+{'=' * 70}
+""", sections)
+    out.flush()
+    out.detach()
+    spool.seek(0)
+    return spool
+
+def load_report_data(username, start_date, end_date):
+    """Build the ``generate_pdf_report`` input for one user straight from SQLite, without a session"""
+    with get_db_connection() as conn:
+        user = conn.execute('SELECT username, name, age FROM users WHERE username = ?', (username,)).fetchone()
+    if not user:
+        return None
+
+    # Everything but the dose history is small; that streams from SQLite while the PDF is laid out
+    sections = {section: rows if section == 'doses' else list(rows)
+                for section, rows in iter_report_sections(username, start_date, end_date, detailed=True)}
+    medications = [{
+        'name': med['name'],
+        'dosageAmount': med['dosage_amount'],
+        'dosageType': med['dosage_type'] or '',
+        'frequency': med['frequency'] or '',
+        'time': med['time'],
+        'taken_today': bool(med['taken_today'])
+    } for med in sections['medications']]
+    for effect in sections['side_effects']:
+        effect['description'] = effect['description'] or ''
+    return {
+        'profile': {'username': user[0], 'name': user[1], 'age': user[2]},
+        'medications': medications,
+        'appointments': sections['appointments'],
+        'side_effects': sections['side_effects'],
+        'adherence_history': sections['adherence'],
+        'medication_history': sections['doses'],
+        'medication_history_count': count_medication_history(username, start_date, end_date),
+        'start_date': start_date,
+        'end_date': end_date
+    }
+
+def generate_user_pdf_report(username, start_date, end_date, report_type="Complete Health Report", progress=None,
+                             template=None, pool=None):
+    """Load one user's report data from SQLite and render it as a PDF.
+
+    The dose history streams from the database while the PDF is laid out.
+    Off the script thread, pass ``template`` and ``pool`` in.
+    """
+    with using_connection_pool(pool):
+        report_data = load_report_data(username, start_date, end_date)
+        if report_data is None:
+            raise LookupError(f"No user named {username!r}")
+        return generate_pdf_report(report_data, report_type, progress, template)
+
 def reports_tab():
     """Reports tab content"""
     st.markdown("<h3 style='color: #ffffff;'>📤 Generate & Download Health Reports</h3>", unsafe_allow_html=True)
@@ -2871,9 +4198,9 @@ def reports_tab():
     
     col1, col2 = st.columns(2)
     with col1:
-        start_date = st.date_input("Start Date", value=date.today() - timedelta(days=30))
+        start_date = st.date_input("Start Date", value=user_now().date() - timedelta(days=30))
     with col2:
-        end_date = st.date_input("End Date", value=date.today())
+        end_date = st.date_input("End Date", value=user_now().date())
     
     report_format = st.radio("Format", ["Text", "CSV", "Detailed", "PDF"], horizontal=True)
     
@@ -2881,119 +4208,43 @@ def reports_tab():
     
     if st.button("📄 Generate Report", use_container_width=True):
         profile = st.session_state.user_profile
-        
-        report_data = {
-            'profile': profile,
-            'medications': st.session_state.medications,
-            'appointments': st.session_state.appointments,
-            'side_effects': st.session_state.side_effects,
-            'adherence_history': st.session_state.get('adherence_history', []),
-            'start_date': start_date.strftime("%Y-%m-%d"),
-            'end_date': end_date.strftime("%Y-%m-%d")
-        }
+        start_str, end_str = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
         
         if report_format == "PDF":
-            pdf_content = generate_pdf_report(report_data, report_type)
-            
-            st.success("PDF report generated successfully!")
-            
-            st.download_button(
-                label="⬇️ Download PDF Report",
-                data=pdf_content,
-                file_name=f"medtimer_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                mime="application/pdf",
-                use_container_width=True
-            )
+            # The worker loads the saved data itself, exactly as batch_reports.py does
+            key = (profile['username'], report_type, start_str, end_str,
+                   st.session_state.setdefault('figure_session_id', uuid.uuid4().hex),
+                   st.session_state.get('data_version', 0))
+            build = functools.partial(generate_user_pdf_report, template=get_report_template(),
+                                      pool=get_connection_pool())
+            job = get_report_jobs().submit(key, build, profile['username'], start_str, end_str, report_type)
+            st.session_state.report_job = {
+                'job_id': job.id,
+                'file_name': f"medtimer_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+            }
         else:
-            report = f"""
-{'=' * 70}
-MEDTIMER HEALTH REPORT
-{'=' * 70}
-
-Patient: {profile['name']}
-Username: {profile['username']}
-Age: {profile['age']}
-Report Type: {report_type}
-Date Range: {start_date} to {end_date}
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-{'=' * 70}
-
-MEDICATIONS ({len(st.session_state.medications)})
-{'-' * 70}
-
-"""
-            
-            if report_format == "CSV":
-                report += "Name,Dosage,Type,Frequency,Time,Status\n"
-                for med in st.session_state.medications:
-                    status = "Taken" if med.get('taken_today', False) else "Pending"
-                    report += f"{med['name']},{med['dosageAmount']},{med['dosageType']},{med['frequency']},{med['time']},{status}\n"
-            else:
-                for i, med in enumerate(st.session_state.medications, 1):
-                    status = "✅ Taken" if med.get('taken_today', False) else "⏰ Pending"
-                    report += f"""
-{i}. {med['name']}
-   - Dosage: {med['dosageAmount']}
-   - Type: {med['dosageType'].capitalize()}
-   - Frequency: {med['frequency'].replace('-', ' ').title()}
-   - Time: {med['time']}
-   - Status: {status}
-
-"""
+            with build_report_file(profile, report_type, start_str, end_str, report_format) as report:
+                preview = b''.join(itertools.islice(report, REPORT_PREVIEW_LINES)).decode('utf-8')
+                report.seek(0)
+                content = report.read()
             
-            report += f"""
-APPOINTMENTS ({len(st.session_state.appointments)})
-{'-' * 70}
-
-"""
-            
-            for i, appt in enumerate(st.session_state.appointments, 1):
-                report += f"""
-{i}. Dr. {appt['doctor']}
-   - Specialty: {appt.get('specialty', 'N/A')}
-   - Date: {appt['date']}
-   - Time: {appt['time']}
-   - Location: {appt.get('location', 'N/A')}
-
-"""
-            
-            report += f"""
-SIDE EFFECTS LOG ({len(st.session_state.side_effects)})
-{'-' * 70}
-
-"""
-            
-            for i, effect in enumerate(st.session_state.side_effects, 1):
-                report += f"""
-{i}. {effect['medication']} - {effect['severity']}
-   - Type: {effect.get('type', 'N/A')}
-   - Date: {effect['date']}
-   - Description: {effect['description']}
-
-"""
-            
-            report += f"""
-{'=' * 70}
-End of Report
-Generated by MedTimer - Your Medication Management Companion
-{'=' * 70}
-"""
-            
-            st.text_area("Preview", report, height=300, key="report_preview")
+            st.text_area("Preview", preview, height=300, key="report_preview")
             
             file_extension = "txt" if report_format != "CSV" else "csv"
             filename = f"medtimer_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_extension}"
             
             st.download_button(
                 label="⬇️ Download Report",
-                data=report,
+                data=content,
                 file_name=filename,
                 mime="text/plain" if report_format != "CSV" else "text/csv",
                 use_container_width=True
             )
             
             st.success("Report generated successfully!")
+    
+    if report_format == "PDF":
+        show_report_job()
 
 def patient_dashboard_page():
     """Main patient dashboard with tabs"""
@@ -3006,8 +4257,6 @@ def patient_dashboard_page():
     age_category = get_age_category(age)
     greeting = get_time_of_day()
     
-    st.markdown(inject_custom_css(age_category), unsafe_allow_html=True)
-    
     col1, col2, col3 = st.columns([2, 4, 2])
     
     with col1:
@@ -3031,31 +4280,19 @@ def patient_dashboard_page():
             st.session_state.page = 'account_type_selection'
             st.rerun()
     
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
-        "📊 Dashboard", "💊 Medications", "👨‍⚕️ Appointments",
-        "⚠️ Side Effects", "🏆 Achievements", "📥 Reports", "📈 Analytics"
-    ])
-    
-    with tab1:
-        dashboard_overview_tab(age_category)
-    
-    with tab2:
-        medications_tab()
-    
-    with tab3:
-        appointments_tab()
-    
-    with tab4:
-        side_effects_tab()
-    
-    with tab5:
-        achievements_tab()
-    
-    with tab6:
-        reports_tab()
-    
-    with tab7:
-        analytics_tab(age_category)
+    # Only the selected section runs; the others cost nothing until picked
+    sections = {
+        "📊 Dashboard": lambda: dashboard_overview_tab(age_category),
+        "💊 Medications": medications_tab,
+        "👨‍⚕️ Appointments": appointments_tab,
+        "⚠️ Side Effects": side_effects_tab,
+        "🏆 Achievements": achievements_tab,
+        "📥 Reports": reports_tab,
+        "📈 Analytics": lambda: analytics_tab(age_category),
+    }
+    section = st.radio("Section", list(sections), horizontal=True,
+                       key="dashboard_section", label_visibility="collapsed")
+    sections[section]()
 
 def caregiver_dashboard_page():
     """Main caregiver dashboard"""
@@ -3212,15 +4449,28 @@ def caregiver_dashboard_page():
 
 def main():
     """Main application router"""
-    init_database()
+    rerun_start = time.perf_counter()
+    try:
+        route_page()
+    finally:
+        logger.debug("Rerun of %s took %.1f ms", st.session_state.get('page'),
+                     (time.perf_counter() - rerun_start) * 1000)
+
+def route_page():
+    """Bootstrap the process, then render the current page"""
+    bootstrap_database()
     initialize_session_state()
+    ensure_daily_rollover()
     
     age_category = 'adult'
     if st.session_state.user_profile:
         age = st.session_state.user_profile.get('age', 25)
         age_category = get_age_category(age)
     
-    st.markdown(inject_custom_css(age_category), unsafe_allow_html=True)
+    # Emitted exactly once per full rerun; fragment reruns keep the existing block
+    css = inject_custom_css(age_category)
+    st.markdown(css, unsafe_allow_html=True)
+    logger.debug("Injected %d bytes of CSS", len(css.encode()))
     
     page = st.session_state.page
     
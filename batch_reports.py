@@ -0,0 +1,164 @@
+"""Batch PDF report generation for every MedTimer patient.
+
+Renders one PDF per patient for a month, without anyone logging in::
+
+    python batch_reports.py reports/ --month 2026-09 --workers 4
+
+Each worker process loads its patient's data straight from SQLite and writes
+the PDF itself, so the parent only ever holds usernames. At most
+``--max-in-flight`` reports are queued at a time and workers are recycled
+every ``--max-tasks-per-child`` reports, which keeps memory flat for any
+number of patients. Finished reports are appended to ``manifest.jsonl`` in
+the output directory; rerunning the same command skips them, so an
+interrupted batch resumes where it stopped.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from urllib.parse import quote
+
+import app
+
+logger = logging.getLogger('medtimer.batch')
+
+MANIFEST = 'manifest.jsonl'
+
+
+def previous_month(today):
+    return (today.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+
+def month_bounds(month):
+    """Get the first and last "YYYY-MM-DD" day of a "YYYY-MM" month"""
+    first = date.fromisoformat(f"{month}-01")
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+
+def report_file_name(username, month):
+    return f"medtimer_report_{month}_{quote(username, safe='')}.pdf"
+
+
+def load_manifest(path):
+    """Get the file names already recorded as finished in a manifest"""
+    if not os.path.exists(path):
+        return set()
+    finished = set()
+    with open(path, encoding='utf-8') as manifest:
+        for line in manifest:
+            try:
+                finished.add(json.loads(line)['file'])
+            except (ValueError, KeyError):
+                # A line cut short by an interrupted run; that report is simply rebuilt
+                continue
+    return finished
+
+
+def patient_usernames():
+    with app.get_db_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT username FROM users WHERE user_type = 'patient' ORDER BY username")]
+
+
+def render_report(username, start_date, end_date, report_type, path):
+    """Worker: load one patient's data, render the PDF and write it to ``path``; returns its size"""
+    try:
+        pdf = app.generate_user_pdf_report(username, start_date, end_date, report_type)
+    except LookupError:
+        # Deleted since the batch started
+        return 0
+    with open(path + '.part', 'wb') as out:
+        out.write(pdf)
+    os.replace(path + '.part', path)
+    return len(pdf)
+
+
+def run_batch(output, month, report_type="Monthly Summary", workers=None, max_in_flight=None,
+              max_tasks_per_child=100, log_every=50):
+    """Render the month's report for every patient not already in the manifest; returns (done, failed)"""
+    os.makedirs(output, exist_ok=True)
+    start_date, end_date = month_bounds(month)
+    manifest_path = os.path.join(output, MANIFEST)
+    finished = load_manifest(manifest_path)
+
+    todo = [(username, report_file_name(username, month)) for username in patient_usernames()]
+    todo = [(username, name) for username, name in todo if name not in finished]
+    logger.info("%d reports to build for %s (%d already done)", len(todo), month, len(finished))
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    done = failed = 0
+    started = time.perf_counter()
+    # Spawned workers open their own database connections instead of inheriting the parent's
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               max_tasks_per_child=max_tasks_per_child)
+
+    with open(manifest_path, 'a', encoding='utf-8') as manifest:
+        def collect(futures, pending):
+            nonlocal done, failed
+            for future in futures:
+                username, name, submitted = pending.pop(future)
+                try:
+                    size = future.result()
+                except Exception:
+                    failed += 1
+                    logger.exception("Report for %s failed", username)
+                    continue
+                manifest.write(json.dumps({'username': username, 'file': name, 'bytes': size,
+                                           'report_type': report_type, 'start_date': start_date,
+                                           'end_date': end_date,
+                                           'seconds': round(time.perf_counter() - submitted, 3)}) + '\n')
+                manifest.flush()
+                done += 1
+                if done % log_every == 0:
+                    elapsed = time.perf_counter() - started
+                    logger.info("%d/%d reports, %.1f reports/s", done, len(todo), done / elapsed)
+
+        pending = {}
+        try:
+            for username, name in todo:
+                if len(pending) >= max_in_flight:
+                    finished_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished_futures, pending)
+                future = pool.submit(render_report, username, start_date, end_date, report_type,
+                                     os.path.join(output, name))
+                pending[future] = (username, name, time.perf_counter())
+            while pending:
+                finished_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished_futures, pending)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    logger.info("Built %d reports (%d failed) in %.1fs, %.1f reports/s",
+                done, failed, elapsed, done / elapsed if elapsed else 0.0)
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render monthly PDF reports for every MedTimer patient")
+    parser.add_argument('output', help="directory to write the PDFs and the resume manifest into")
+    parser.add_argument('--month', default=previous_month(date.today()),
+                        help="month to report on as YYYY-MM (default: last month)")
+    parser.add_argument('--report-type', default="Monthly Summary")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--max-in-flight', type=int,
+                        help="reports queued at once, bounding memory (default: twice the workers)")
+    parser.add_argument('--max-tasks-per-child', type=int, default=100,
+                        help="restart each worker after this many reports")
+    parser.add_argument('--log-every', type=int, default=50, help="log throughput every N reports")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    app.bootstrap_database()
+    _, failed = run_batch(args.output, args.month, args.report_type, args.workers, args.max_in_flight,
+                          args.max_tasks_per_child, args.log_every)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
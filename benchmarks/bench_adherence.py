@@ -0,0 +1,87 @@
+"""Per-click latency of the adherence history update.
+
+Compares the previous SELECT-then-UPDATE/INSERT round trip with the single
+INSERT ... ON CONFLICT upsert in app.record_adherence(), against a fresh
+database populated with a year of adherence rows per user.
+
+    python benchmarks/bench_adherence.py --users 200 --clicks 5000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_record_adherence(conn, username, day):
+    """The pre-upsert implementation, with adherence computed in Python"""
+    c = conn.cursor()
+    meds = c.execute('SELECT taken_today FROM medications WHERE username = ?', (username,)).fetchall()
+    adherence = (sum(m[0] for m in meds) / len(meds) * 100) if meds else 0
+
+    c.execute('SELECT id FROM adherence_history WHERE username = ? AND date = ?', (username, day))
+    existing = c.fetchone()
+    if existing:
+        c.execute('UPDATE adherence_history SET adherence = ?, updated = ? WHERE id = ?',
+                  (adherence, datetime.now().strftime("%H:%M:%S"), existing[0]))
+    else:
+        c.execute('INSERT INTO adherence_history (username, date, adherence, updated) VALUES (?, ?, ?, ?)',
+                  (username, day, adherence, datetime.now().strftime("%H:%M:%S")))
+
+
+def populate(app, users):
+    today = date.today()
+    with app.get_db_connection() as conn, conn:
+        for n in range(users):
+            username = f"bench_user_{n}"
+            conn.executemany('''INSERT INTO medications (username, name, time, taken_today)
+                                VALUES (?, ?, ?, ?)''',
+                             [(username, f"Med {m}", '09:00', m % 2) for m in range(5)])
+            conn.executemany('''INSERT INTO adherence_history (username, date, adherence, updated)
+                                VALUES (?, ?, ?, ?)''',
+                             [(username, (today - timedelta(days=d)).strftime("%Y-%m-%d"), 50.0, '00:00:00')
+                              for d in range(1, 366)])
+
+
+def time_clicks(app, fn, users, clicks):
+    rng = random.Random(0)
+    day = date.today().strftime("%Y-%m-%d")
+    latencies = []
+    for _ in range(clicks):
+        username = f"bench_user_{rng.randrange(users)}"
+        start = time.perf_counter()
+        app.run_write(fn, username, day)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--clicks', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['MEDTIMER_DB_PATH'] = os.path.join(tmp, 'bench.db')
+        sys.path.insert(0, ROOT)
+        import app
+
+        app.init_database()
+        populate(app, args.users)
+
+        for label, fn in [('select+update', legacy_record_adherence),
+                          ('upsert', app.record_adherence)]:
+            latencies = time_clicks(app, fn, args.users, args.clicks)
+            mean = sum(latencies) / len(latencies)
+            print(f"{label:<14} mean={mean * 1e6:8.1f}us "
+                  f"median={latencies[len(latencies) // 2] * 1e6:8.1f}us "
+                  f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1e6:8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
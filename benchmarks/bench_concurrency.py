@@ -0,0 +1,105 @@
+"""Concurrency benchmark for MedTimer's SQLite storage modes.
+
+Drives N simulated sessions, each repeatedly doing what a "Take Now" click
+does: append a medication history row and save the user's changed rows.
+Every storage mode runs in its own subprocess against a fresh database.
+
+    python benchmarks/bench_concurrency.py --sessions 16 --clicks 50
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['rollback', 'wal']
+
+
+def simulate_session(app, index, clicks, latencies, errors):
+    username = f"bench_user_{index}"
+    profile = {'username': username, 'name': f"Bench {index}", 'age': 40,
+               'userType': 'patient', 'diseases': [], 'timezone': None}
+    medications = [
+        {'id': n, 'name': f"Med {n}", 'dosageType': 'pill', 'dosageAmount': '10mg',
+         'frequency': 'once-daily', 'time': f"{8 + n:02d}:00", 'color': 'blue',
+         'taken_today': False}
+        for n in range(1, 6)
+    ]
+    side_effects = [
+        {'id': n, 'medication': 'Med 1', 'severity': 'Mild', 'type': 'Nausea',
+         'description': 'bench', 'date': '2025-01-01'}
+        for n in range(1, 201)
+    ]
+    entities = {'diseases': [], 'medications': medications,
+                'appointments': [], 'side_effects': side_effects}
+
+    snapshot, inserted = app.run_write(app.sync_user_rows, username, profile, entities, None)
+    for item, row_id in inserted:
+        item['id'] = row_id
+
+    for click in range(clicks):
+        med = medications[click % len(medications)]
+        med['taken_today'] = not med.get('taken_today', False)
+        start = time.perf_counter()
+        try:
+            app.run_write(app.record_medication_event, username, med['id'], 'taken',
+                          app.zone_now(profile['timezone']))
+            snapshot, _ = app.run_write(app.sync_user_rows, username, profile, entities, snapshot)
+        except Exception as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - start)
+
+
+def run_mode(sessions, clicks):
+    sys.path.insert(0, ROOT)
+    import app
+
+    app.init_database()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=simulate_session, args=(app, i, clicks, latencies, errors))
+        for i in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{app.STORAGE_MODE:<10} clicks={len(latencies):<6} "
+          f"throughput={len(latencies) / elapsed:8.1f}/s "
+          f"median={statistics.median(latencies) * 1000:7.2f}ms "
+          f"p95={p95 * 1000:7.2f}ms errors={len(errors)}")
+    for message in sorted(set(errors))[:3]:
+        print(f"    {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--clicks', type=int, default=50)
+    parser.add_argument('--mode', choices=MODES, help="run a single mode in-process")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.sessions, args.clicks)
+        return
+
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, MEDTIMER_STORAGE_MODE=mode,
+                       MEDTIMER_DB_PATH=os.path.join(tmp, 'bench.db'))
+            subprocess.run([sys.executable, __file__, '--mode', mode,
+                            '--sessions', str(args.sessions), '--clicks', str(args.clicks)],
+                           env=env, check=True, stderr=subprocess.DEVNULL)
+
+
+if __name__ == '__main__':
+    main()
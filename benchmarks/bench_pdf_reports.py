@@ -0,0 +1,66 @@
+"""Reports per second of app.generate_pdf_report().
+
+Compares building the paragraph and table styles for every report, as
+generate_pdf_report() used to, with sharing one app.ReportTemplate across
+all builds. Reports are small by default, where the style setup matters most.
+
+    python benchmarks/bench_pdf_reports.py --reports 300 --medications 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample_report_data(medications, appointments, side_effects):
+    return {
+        'profile': {'username': 'bench_user', 'name': "Bench User", 'age': 42},
+        'medications': [{'name': f"Med {n}", 'dosageAmount': '10mg', 'dosageType': 'pill',
+                         'frequency': 'twice-daily', 'time': '09:00', 'taken_today': n % 2 == 0}
+                        for n in range(medications)],
+        'appointments': [{'doctor': f"Doctor {n}", 'specialty': 'General', 'date': '2026-09-01',
+                          'time': '10:00', 'location': 'Clinic'} for n in range(appointments)],
+        'side_effects': [{'medication': 'Med 0', 'severity': 'Mild', 'type': 'Nausea', 'date': '2026-09-02',
+                          'description': 'Felt queasy after the morning dose'} for _ in range(side_effects)],
+    }
+
+
+def time_reports(build, reports):
+    start = time.perf_counter()
+    for _ in range(reports):
+        build()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=300)
+    parser.add_argument('--medications', type=int, default=5)
+    parser.add_argument('--appointments', type=int, default=3)
+    parser.add_argument('--side-effects', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['MEDTIMER_DB_PATH'] = os.path.join(tmp, 'bench.db')
+        sys.path.insert(0, ROOT)
+        import app
+
+        data = sample_report_data(args.medications, args.appointments, args.side_effects)
+        template = app.ReportTemplate()
+        # Warm up imports and fonts so neither variant pays for them
+        app.generate_pdf_report(data, template=template)
+
+        for label, build in [
+            ('per-report', lambda: app.generate_pdf_report(data, template=app.ReportTemplate())),
+            ('shared', lambda: app.generate_pdf_report(data, template=template)),
+        ]:
+            elapsed = time_reports(build, args.reports)
+            print(f"{label:<11} {args.reports / elapsed:8.1f} reports/s "
+                  f"mean={elapsed / args.reports * 1e3:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Cold-start import cost of app.py, measured with ``python -X importtime``.
+
+Each run imports app in a fresh interpreter (as a new container would) and
+reports the total import time plus the slowest top-level packages. With
+``--eager`` the lazily imported plotting, dataframe and PDF libraries are
+imported as well, which is what every cold start paid before they moved
+into the functions that use them.
+
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --runs 5 --eager
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(eager, db_path):
+    """Import app in a fresh interpreter; returns {top-level package: cumulative microseconds}"""
+    code = "import app"
+    if eager:
+        code += "; " + "; ".join(f"import {name}" for name in
+                                 ('numpy', 'pandas', 'plotly.graph_objects', 'reportlab.platypus'))
+    env = dict(os.environ, MEDTIMER_DB_PATH=db_path, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level under their parent,
+        # so top-level cumulative times add up to the whole import
+        if not name[1:].startswith(' '):
+            packages[name.strip()] = packages.get(name.strip(), 0) + int(cumulative)
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--eager', action='store_true',
+                        help="also import the lazily loaded libraries, as the old module header did")
+    args = parser.parse_args()
+
+    totals = []
+    by_package = defaultdict(list)
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.runs):
+            packages = import_profile(args.eager, os.path.join(tmp, 'bench.db'))
+            totals.append(sum(packages.values()))
+            for name, micros in packages.items():
+                by_package[name].append(micros)
+
+    totals.sort()
+    print(f"{'eager' if args.eager else 'lazy'} import of app: "
+          f"median={totals[len(totals) // 2] / 1000:.1f}ms min={totals[0] / 1000:.1f}ms over {args.runs} runs")
+    slowest = sorted(by_package.items(), key=lambda item: -sorted(item[1])[len(item[1]) // 2])
+    for name, samples in slowest[:args.top]:
+        print(f"  {name:<32} {sorted(samples)[len(samples) // 2] / 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
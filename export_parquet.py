@@ -0,0 +1,148 @@
+"""Bulk Parquet export of MedTimer history for analytics.
+
+Dumps ``medication_history``, ``adherence_history``, ``side_effects`` and
+``appointments`` for one user (``--user``) or everyone into a Hive-style
+partitioned dataset::
+
+    <output>/<table>/month=YYYY-MM/username=<user>/part-0.parquet
+
+Rows are read from SQLite cursors in (username, date) order, which the
+per-user date indexes already provide, so every partition is a contiguous
+run: at most one ``ParquetWriter`` is open at a time and memory stays at one
+batch regardless of history size. Read it back with
+``pyarrow.dataset.dataset(path, partitioning='hive')`` or any Parquet engine.
+"""
+import argparse
+import itertools
+import logging
+import os
+import shutil
+import sys
+import time
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import app
+
+logger = logging.getLogger('medtimer.export')
+
+DATE = 'date'
+TIMESTAMP = 'timestamp'
+
+# Table -> exported columns and their Arrow types; 'username' and 'date' come
+# first in every query and drive the partitioning (username is not stored in
+# the files, it is restored from the path)
+EXPORT_TABLES = {
+    'medication_history': [('date', DATE), ('id', pa.int64()), ('medication_id', pa.int64()),
+                           ('action', pa.string()), ('timestamp', TIMESTAMP)],
+    'adherence_history': [('date', DATE), ('adherence', pa.float64()), ('updated', pa.string())],
+    'side_effects': [('date', DATE), ('id', pa.int64()), ('medication', pa.string()),
+                     ('severity', pa.string()), ('type', pa.string()), ('description', pa.string()),
+                     ('reported_at', TIMESTAMP)],
+    'appointments': [('date', DATE), ('id', pa.int64()), ('doctor', pa.string()),
+                     ('specialty', pa.string()), ('time', pa.string()), ('location', pa.string()),
+                     ('phone', pa.string()), ('notes', pa.string()), ('created_at', TIMESTAMP)],
+}
+
+
+def arrow_schema(columns):
+    return pa.schema([(name, pa.date32() if kind == DATE else pa.timestamp('s') if kind == TIMESTAMP else kind)
+                      for name, kind in columns])
+
+
+def to_arrow(values, kind):
+    """Convert one column of SQLite values, parsing the text dates and timestamps"""
+    if kind == DATE:
+        parsed = pc.strptime(pa.array(values, type=pa.string()), format='%Y-%m-%d', unit='s', error_is_null=True)
+        return parsed.cast(pa.date32())
+    if kind == TIMESTAMP:
+        return pc.strptime(pa.array(values, type=pa.string()), format='%Y-%m-%d %H:%M:%S', unit='s',
+                           error_is_null=True)
+    return pa.array(values, type=kind)
+
+
+def partition_key(row):
+    username, day = row[0], row[1]
+    return username, (day or '')[:7] or 'unknown'
+
+
+def partition_path(output, table, username, month):
+    return os.path.join(output, table, f"month={month}", f"username={quote(username or '', safe='')}",
+                        'part-0.parquet')
+
+
+def export_table(conn, table, output, username=None, batch_size=10000, compression='zstd'):
+    """Stream one table into its partitioned Parquet files; returns (rows, files)"""
+    columns = EXPORT_TABLES[table]
+    schema = arrow_schema(columns)
+    sql = f"SELECT username, {', '.join(name for name, _ in columns)} FROM {table}"
+    params = ()
+    if username:
+        sql += " WHERE username = ?"
+        params = (username,)
+    cursor = conn.execute(sql + " ORDER BY username, date", params)
+
+    writer = current = None
+    rows = files = 0
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            for key, group in itertools.groupby(batch, key=partition_key):
+                if key != current:
+                    if writer:
+                        writer.close()
+                    path = partition_path(output, table, *key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writer = pq.ParquetWriter(path, schema, compression=compression)
+                    current = key
+                    files += 1
+                group = list(group)
+                values = list(zip(*group))[1:]
+                writer.write_batch(pa.record_batch([to_arrow(column, kind) for column, (_, kind)
+                                                    in zip(values, columns)], schema=schema))
+                rows += len(group)
+    finally:
+        if writer:
+            writer.close()
+    return rows, files
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export MedTimer history to partitioned Parquet files")
+    parser.add_argument('output', help="directory to write the dataset into")
+    parser.add_argument('--user', help="only export this username (default: all users)")
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES), default=list(EXPORT_TABLES))
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows fetched from SQLite per batch")
+    parser.add_argument('--compression', default='zstd', help="Parquet codec (zstd, snappy, gzip, none)")
+    parser.add_argument('--overwrite', action='store_true', help="replace tables already exported to OUTPUT")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    app.bootstrap_database()
+
+    for table in args.tables:
+        table_dir = os.path.join(args.output, table)
+        if os.path.exists(table_dir):
+            if not args.overwrite:
+                sys.exit(f"{table_dir} already exists; pass --overwrite to replace it")
+            shutil.rmtree(table_dir)
+
+        start = time.perf_counter()
+        with app.get_db_connection() as conn:
+            rows, files = export_table(conn, table, args.output, args.user, args.batch_size, args.compression)
+        size = directory_size(table_dir) if files else 0
+        logger.info("%s: %d rows -> %d files, %.1f KiB in %.2fs",
+                    table, rows, files, size / 1024, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Background reminder scheduler for MedTimer.
+
+Runs alongside the Streamlit app (``python reminder_scheduler.py``) and fires
+medication reminders into the ``reminders`` table at the exact minute they
+are due, whether or not any patient has the dashboard open.
+
+Every patient's dose slots are kept in a single timer heap keyed by their
+next fire time, so each fired reminder costs O(log n) regardless of how many
+patients are scheduled. Fire times are computed in each patient's own
+timezone, the same one the app materializes their reminders in. The heap is rebuilt from SQLite periodically to pick
+up medication changes made in the app, and each rebuild also runs the
+midnight rollover so ``taken_today`` resets even when nobody is logged in.
+"""
+import argparse
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import schedule
+
+import app
+
+logger = logging.getLogger('medtimer.scheduler')
+
+
+def next_occurrence(minute_of_day, after):
+    """Get the first datetime strictly after ``after`` falling on ``minute_of_day`` in its timezone"""
+    candidate = after.replace(hour=minute_of_day // 60, minute=minute_of_day % 60, second=0, microsecond=0)
+    if candidate <= after:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def load_dose_slots():
+    """Load every (username, timezone, medication_id, minute_of_day) dose slot from the database"""
+    with app.get_db_connection() as conn:
+        return conn.execute('''SELECT m.username, u.timezone, s.medication_id, s.slot_minute
+                               FROM medication_slots s
+                               JOIN medications m ON m.id = s.medication_id
+                               LEFT JOIN users u ON u.username = m.username''').fetchall()
+
+
+def insert_reminders(conn, fired):
+    """Mark fired reminders in the queue, creating slots the app has not materialized yet.
+
+    ``fire_at`` is in the patient's timezone, so its wall-clock time is the
+    reminder_time the app uses for that slot.
+    """
+    fired_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany('''INSERT INTO reminders (username, medication_id, reminder_time, acknowledged, created_at, fired_at)
+                        VALUES (?, ?, ?, 0, ?, ?)
+                        ON CONFLICT(username, medication_id, reminder_time) DO UPDATE SET fired_at = excluded.fired_at''',
+                     [(username, medication_id, fire_at.strftime("%Y-%m-%d %H:%M"), fired_at, fired_at)
+                      for fire_at, username, medication_id in fired])
+
+
+class ReminderScheduler:
+    """Timer heap of every patient's next dose, fired into the reminders table"""
+
+    def __init__(self, notify=False):
+        self.notify = notify
+        self.heap = []
+        # Everything up to this instant (UTC) has been fired; reloads schedule strictly after it
+        self.watermark = datetime.now(timezone.utc)
+
+    def reload(self):
+        """Roll users past midnight over to their new day, then rebuild the heap from the database"""
+        rolled_over = app.run_write(app.rollover_users)
+        if rolled_over:
+            logger.info("Rolled %d users over to a new day", rolled_over)
+        # Patients without a known timezone follow the server's, as they do in the app
+        server_zone = datetime.now().astimezone().tzinfo
+        self.heap = [(next_occurrence(minute, self.watermark.astimezone(app.zone_info(tz_name) or server_zone)),
+                      username, medication_id, minute)
+                     for username, tz_name, medication_id, minute in load_dose_slots()]
+        heapq.heapify(self.heap)
+        logger.info("Scheduled %d dose slots", len(self.heap))
+
+    def fire_due(self, now):
+        """Fire every reminder due at or before ``now`` (timezone-aware) and reschedule it for the next day"""
+        fired = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, username, medication_id, minute = self.heap[0]
+            fired.append((fire_at, username, medication_id))
+            heapq.heapreplace(self.heap, (next_occurrence(minute, fire_at), username, medication_id, minute))
+        self.watermark = now
+
+        if fired:
+            app.run_write(insert_reminders, fired)
+            logger.info("Fired %d reminders", len(fired))
+            if self.notify:
+                self.show_notifications(fired)
+        return fired
+
+    def show_notifications(self, fired):
+        from plyer import notification
+
+        for fire_at, username, medication_id in fired:
+            notification.notify(title="MedTimer",
+                                message=f"Time for medication #{medication_id} ({fire_at:%H:%M})",
+                                app_name="MedTimer", timeout=10)
+
+    def seconds_until_next(self, now):
+        if not self.heap:
+            return None
+        return max((self.heap[0][0] - now).total_seconds(), 0)
+
+    def run_forever(self, refresh_minutes=5):
+        self.reload()
+        schedule.every(refresh_minutes).minutes.do(self.reload)
+        while True:
+            now = datetime.now(timezone.utc)
+            self.fire_due(now)
+            schedule.run_pending()
+
+            waits = [wait for wait in (self.seconds_until_next(now), schedule.idle_seconds()) if wait is not None]
+            time.sleep(min(waits + [60]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire MedTimer medication reminders on time")
+    parser.add_argument('--refresh-minutes', type=int, default=5,
+                        help="how often to reload medication schedules from the database")
+    parser.add_argument('--notify', action='store_true',
+                        help="also show a desktop notification for each reminder (uses plyer)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    app.bootstrap_database()
+    ReminderScheduler(notify=args.notify).run_forever(args.refresh_minutes)
+
+
+if __name__ == '__main__':
+    main()
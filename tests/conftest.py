@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app reads its database path on import; never let the tests touch a real medtimer.db
+_db_dir = tempfile.TemporaryDirectory(prefix='medtimer-tests-')
+os.environ['MEDTIMER_DB_PATH'] = os.path.join(_db_dir.name, 'medtimer.db')
@@ -0,0 +1,73 @@
+"""The background DatabaseWriter: batched commits with one savepoint per job."""
+import sqlite3
+import threading
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'medtimer.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE notes (body TEXT)')
+    conn.close()
+    return path
+
+
+def add_note(conn, body):
+    conn.execute('INSERT INTO notes (body) VALUES (?)', (body,))
+    return conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+
+
+def add_note_then_fail(conn, body):
+    add_note(conn, body)
+    raise ValueError(body)
+
+
+def notes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT body FROM notes ORDER BY rowid')]
+    finally:
+        conn.close()
+
+
+def test_failing_job_rolls_back_only_its_savepoint(db_path):
+    writer = app.DatabaseWriter(db_path)
+    started, release = threading.Event(), threading.Event()
+
+    def hold_writer(conn):
+        started.set()
+        release.wait(5)
+
+    try:
+        # While the writer is stuck in its first batch, the next jobs queue up and form one batch
+        blocker = writer.submit(hold_writer)
+        assert started.wait(5)
+        first = writer.submit(add_note, 'first')
+        broken = writer.submit(add_note_then_fail, 'broken')
+        last = writer.submit(add_note, 'last')
+        release.set()
+
+        assert blocker.result(5) is None
+        assert first.result(5) == 1
+        with pytest.raises(ValueError, match='broken'):
+            broken.result(5)
+        # 'last' ran after the rolled-back job inside the same transaction and sees only 'first'
+        assert last.result(5) == 2
+    finally:
+        release.set()
+        writer.close()
+
+    assert notes(db_path) == ['first', 'last']
+
+
+def test_close_flushes_queued_jobs(db_path):
+    writer = app.DatabaseWriter(db_path, batch_size=2)
+    futures = [writer.submit(add_note, str(n)) for n in range(5)]
+    writer.close()
+
+    assert [future.result(0) for future in futures] == [1, 2, 3, 4, 5]
+    assert notes(db_path) == ['0', '1', '2', '3', '4']
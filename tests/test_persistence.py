@@ -0,0 +1,236 @@
+"""SQLite persistence: schema migrations, dirty-row sync and the daily rollover, on a temporary database."""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """A fresh database file, configured like the app's pooled connections"""
+    conn = sqlite3.connect(tmp_path / 'medtimer.db')
+    app.configure_connection(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def migrated(conn):
+    app.migrate_database(conn)
+    return conn
+
+
+def create_baseline_database(conn):
+    """Lay out the tables and data of a database written before schema migrations existed"""
+    app.migration_initial_schema(conn)
+    conn.executemany('''INSERT INTO users (username, name, age, email, password, user_type, phone, relationship,
+                                           experience, notes, created_at)
+                        VALUES (?, ?, ?, '', '', 'patient', '', '', '', '', '2026-08-01 09:00:00')''',
+                     [('alice', 'Alice', 70), ('bob', 'Bob', 35)])
+    conn.executemany('''INSERT INTO medications (id, username, name, dosage_type, dosage_amount, frequency, time,
+                                                 color, instructions, taken_today, created_at)
+                        VALUES (?, 'alice', ?, 'pill', '10mg', 'daily', ?, 'blue', '', 1, '2026-08-01 09:00:00')''',
+                     [(1, 'Aspirin', '08:00'), (2, 'Vitamin D', 'morning')])
+    # The old save path appended a new adherence row on every save
+    conn.executemany("INSERT INTO adherence_history (username, date, adherence, updated) VALUES ('alice', ?, ?, ?)",
+                     [('2026-09-01', 50.0, '08:00:00'), ('2026-09-01', 100.0, '20:00:00'),
+                      ('2026-09-02', 0.0, '08:00:00')])
+    conn.executemany('''INSERT INTO reminders (username, medication_id, reminder_time, acknowledged, created_at)
+                        VALUES ('alice', 1, ?, ?, ?)''',
+                     [('2026-09-01 08:00', 1, '2026-09-01 08:05:00'), ('2026-09-01 08:00', 0, '2026-09-01 08:06:00'),
+                      ('2026-09-02 08:00', 0, '2026-09-02 08:00:00')])
+    conn.execute('''INSERT INTO medication_history (username, medication_id, action, timestamp, date)
+                    VALUES ('alice', 1, 'taken', '2026-09-01 08:05:00', '2026-09-01')''')
+    conn.commit()
+
+
+def test_migrate_baseline_database(conn):
+    create_baseline_database(conn)
+
+    version = app.migrate_database(conn)
+
+    assert version == app.MIGRATIONS[-1][0]
+    assert [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')] == \
+        [migration[0] for migration in app.MIGRATIONS]
+    # Duplicate adherence rows collapse to the latest one per day, keeping their ids through the rebuild
+    assert conn.execute('SELECT id, date, adherence FROM adherence_history ORDER BY date').fetchall() == \
+        [(2, '2026-09-01', 100.0), (3, '2026-09-02', 0.0)]
+    # One reminder per slot and day, the first one kept
+    assert conn.execute('SELECT reminder_time, acknowledged FROM reminders ORDER BY reminder_time').fetchall() == \
+        [('2026-09-01 08:00', 1), ('2026-09-02 08:00', 0)]
+    # Only well-formed main times become slots; a single slot has no reminder index
+    assert conn.execute('SELECT medication_id, slot_minute, reminder_index FROM medication_slots').fetchall() == \
+        [(1, 8 * 60, None)]
+    assert conn.execute('SELECT date, taken_at FROM dose_events').fetchall() == \
+        [('2026-09-01', '2026-09-01 08:05:00')]
+    rollover_dates = dict(conn.execute('SELECT username, last_rollover_date FROM users'))
+    assert rollover_dates['alice'] == '2026-09-01'
+    assert rollover_dates['bob'] is not None
+
+
+def test_migrate_database_is_idempotent(migrated):
+    applied = migrated.execute('SELECT version, applied_at FROM schema_version').fetchall()
+
+    assert app.migrate_database(migrated) == app.MIGRATIONS[-1][0]
+    assert migrated.execute('SELECT version, applied_at FROM schema_version').fetchall() == applied
+
+
+def test_failed_migration_rolls_back(migrated, monkeypatch):
+    def broken_migration(conn):
+        conn.execute('CREATE TABLE half_done (id INTEGER)')
+        raise RuntimeError("migration failed")
+
+    latest = app.MIGRATIONS[-1][0]
+    monkeypatch.setattr(app, 'MIGRATIONS', app.MIGRATIONS + [(latest + 1, 'broken', broken_migration)])
+
+    with pytest.raises(RuntimeError):
+        app.migrate_database(migrated)
+    assert migrated.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] == latest
+    assert migrated.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+
+
+def sync(conn, profile, entities, persisted):
+    """Run sync_user_rows in one transaction and hand out the new ids, as save_user_data does"""
+    with conn:
+        snapshot, inserted = app.sync_user_rows(conn, profile['username'], profile, entities, persisted)
+    for item, row_id in inserted:
+        item['id'] = row_id
+    return snapshot, inserted
+
+
+def test_sync_user_rows_insert_update_delete(migrated):
+    profile = {'username': 'alice', 'name': 'Alice', 'age': 70, 'userType': 'patient', 'timezone': 'UTC'}
+    medication = {'id': 1, 'name': 'Aspirin', 'dosageType': 'pill', 'dosageAmount': '100mg',
+                  'frequency': 'twice-daily', 'time': '08:00', 'reminder_times': ['08:00', '20:00'],
+                  'color': 'blue', 'taken_today': False}
+    appointment = {'id': 1, 'doctor': 'Dr. Lee', 'specialty': 'GP', 'date': '2026-10-20', 'time': '10:00'}
+    entities = {'diseases': [], 'medications': [medication], 'appointments': [appointment], 'side_effects': []}
+
+    snapshot, inserted = sync(migrated, profile, entities, None)
+
+    assert len(inserted) == 2
+    assert migrated.execute("SELECT name, timezone FROM users WHERE username = 'alice'").fetchone() == ('Alice', 'UTC')
+    medication_id = medication['id']
+    assert migrated.execute('SELECT name, dosage_amount FROM medications').fetchall() == [('Aspirin', '100mg')]
+    assert migrated.execute('SELECT slot_minute, reminder_index FROM medication_slots ORDER BY slot_minute').fetchall() == \
+        [(8 * 60, 0), (20 * 60, 1)]
+
+    # Saving unchanged state writes nothing
+    changes = migrated.total_changes
+    snapshot, inserted = sync(migrated, profile, entities, snapshot)
+    assert inserted == []
+    assert migrated.total_changes == changes
+
+    with migrated:
+        app.record_dose_events(migrated, medication_id, datetime(2026, 10, 17, 8, 5), ['08:00', '20:00'])
+    medication['dosageAmount'] = '200mg'
+    medication['reminder_times'] = ['08:00', '21:00']
+    entities['appointments'] = []
+    entities['side_effects'] = [{'id': 1, 'medication': 'Aspirin', 'severity': 'Mild', 'type': 'Nausea',
+                                 'description': 'Queasy', 'date': '2026-10-17'}]
+
+    snapshot, inserted = sync(migrated, profile, entities, snapshot)
+
+    assert [item for item, _ in inserted] == entities['side_effects']
+    # Updated in place: same id, new values
+    assert migrated.execute('SELECT id, dosage_amount FROM medications').fetchall() == [(medication_id, '200mg')]
+    assert migrated.execute('SELECT COUNT(*) FROM appointments').fetchone()[0] == 0
+    assert migrated.execute('SELECT medication, severity FROM side_effects').fetchall() == [('Aspirin', 'Mild')]
+    # The kept slot keeps its dose event; the removed slot's event goes with it
+    assert migrated.execute('''SELECT s.slot_minute, s.reminder_index, e.date FROM medication_slots s
+                               LEFT JOIN dose_events e ON e.slot_id = s.id
+                               ORDER BY s.slot_minute''').fetchall() == \
+        [(8 * 60, 0, '2026-10-17'), (21 * 60, 1, None)]
+    assert migrated.execute('SELECT COUNT(*) FROM dose_events').fetchone()[0] == 1
+
+    entities['medications'] = []
+    snapshot, _ = sync(migrated, profile, entities, snapshot)
+
+    assert migrated.execute('SELECT COUNT(*) FROM medications').fetchone()[0] == 0
+    assert migrated.execute('SELECT COUNT(*) FROM medication_slots').fetchone()[0] == 0
+    assert migrated.execute('SELECT COUNT(*) FROM dose_events').fetchone()[0] == 0
+    assert snapshot['medications'] == {} and snapshot['medication_slots'] == {}
+
+
+def test_malformed_times_get_no_slot(migrated):
+    profile = {'username': 'alice', 'name': 'Alice', 'age': 70, 'userType': 'patient'}
+    legacy = {'id': 1, 'name': 'Old', 'time': 'morning', 'taken_today': False}
+    mixed = {'id': 2, 'name': 'New', 'time': '08:00', 'reminder_times': ['08:00', 'noon', '25:00', '20:00'],
+             'taken_today': False}
+    entities = {'diseases': [], 'medications': [legacy, mixed], 'appointments': [], 'side_effects': []}
+
+    snapshot, _ = sync(migrated, profile, entities, None)
+
+    assert snapshot['medication_slots'] == {str(legacy['id']): (), str(mixed['id']): ((8 * 60, 0), (20 * 60, 3))}
+    assert [entry[0] for entry in app.build_schedule_index(entities['medications'])] == [8 * 60, 20 * 60]
+
+def test_rollover_users(migrated):
+    tokyo_today = app.zone_now('Asia/Tokyo').strftime("%Y-%m-%d")
+    server_today = app.zone_now().strftime("%Y-%m-%d")
+    migrated.executemany("INSERT INTO users (username, user_type, timezone, last_rollover_date) VALUES (?, 'patient', ?, ?)",
+                         [('alice', 'Asia/Tokyo', '2026-09-01'), ('bob', None, server_today),
+                          ('carol', 'Asia/Tokyo', None)])
+    migrated.executemany('''INSERT INTO medications (username, name, time, taken_today) VALUES (?, ?, '08:00', ?)''',
+                         [('alice', 'Aspirin', 1), ('alice', 'Vitamin D', 0), ('bob', 'Aspirin', 1)])
+    migrated.commit()
+
+    with migrated:
+        rolled_over = app.rollover_users(migrated)
+
+    # alice closes out her last day; carol never had one; bob is already on today
+    assert rolled_over == 2
+    assert migrated.execute('SELECT username, date, adherence FROM adherence_history').fetchall() == \
+        [('alice', '2026-09-01', 50.0)]
+    assert dict(migrated.execute('SELECT username, last_rollover_date FROM users')) == \
+        {'alice': tokyo_today, 'bob': server_today, 'carol': tokyo_today}
+    assert migrated.execute('SELECT username, SUM(taken_today) FROM medications GROUP BY username').fetchall() == \
+        [('alice', 0), ('bob', 1)]
+
+    with migrated:
+        assert app.rollover_users(migrated) == 0
+
+
+def test_interrupted_rollover_leaves_nothing_behind_in_rollback_mode(migrated, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'STORAGE_MODE', 'rollback')
+    migrated.execute("INSERT INTO users (username, user_type, last_rollover_date) VALUES ('alice', 'patient', '2026-09-01')")
+    migrated.executemany("INSERT INTO medications (username, name, time, taken_today) VALUES ('alice', ?, '08:00', ?)",
+                         [('Aspirin', 1), ('Vitamin D', 0)])
+    # Fail the last statement of the first rollover, after adherence and taken_today were written
+    migrated.execute('''CREATE TRIGGER interrupt_rollover BEFORE UPDATE OF last_rollover_date ON users
+                        BEGIN SELECT RAISE(ABORT, 'interrupted'); END''')
+    migrated.commit()
+
+    pool = app.ConnectionPool(str(tmp_path / 'medtimer.db'))
+    try:
+        with app.using_connection_pool(pool):
+            with pytest.raises(sqlite3.DatabaseError, match='interrupted'):
+                app.run_write(app.rollover_users)
+            migrated.execute('DROP TRIGGER interrupt_rollover')
+            migrated.commit()
+            assert app.run_write(app.rollover_users) == 1
+    finally:
+        pool.close_all()
+
+    # The retry still sees the day's doses; a half-applied first pass would have closed it at 0%
+    assert migrated.execute('SELECT date, adherence FROM adherence_history').fetchall() == [('2026-09-01', 50.0)]
+    assert migrated.execute('SELECT SUM(taken_today) FROM medications').fetchone()[0] == 0
+
+
+def test_rollover_users_for_one_user(migrated):
+    migrated.executemany("INSERT INTO users (username, user_type, last_rollover_date) VALUES (?, 'patient', '2026-09-01')",
+                         [('alice',), ('bob',)])
+    migrated.executemany("INSERT INTO medications (username, name, time, taken_today) VALUES (?, 'Aspirin', '08:00', 1)",
+                         [('alice',), ('bob',)])
+    migrated.commit()
+
+    with migrated:
+        assert app.rollover_users(migrated, 'alice') == 1
+
+    # bob is left for the scheduler's full pass
+    assert migrated.execute('SELECT username FROM adherence_history').fetchall() == [('alice',)]
+    assert dict(migrated.execute('SELECT username, last_rollover_date FROM users'))['bob'] == '2026-09-01'
+    assert dict(migrated.execute('SELECT username, taken_today FROM medications')) == {'alice': 0, 'bob': 1}
+    with migrated:
+        assert app.rollover_users(migrated, 'carol') == 0
@@ -0,0 +1,49 @@
+"""PDF reports built from SQLite, as the Reports tab and batch_reports.py do."""
+import sqlite3
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'medtimer.db')
+    conn = sqlite3.connect(path)
+    app.migrate_database(conn)
+    conn.execute("INSERT INTO users (username, name, age, user_type) VALUES ('alice', 'Alice', 70, 'patient')")
+    conn.execute('''INSERT INTO medications (username, name, time, taken_today, created_at)
+                    VALUES ('alice', 'Aspirin', '08:00', 0, '2026-01-01 00:00:00')''')
+    conn.executemany('''INSERT INTO medication_history (username, medication_id, action, timestamp, date)
+                        VALUES ('alice', 1, 'taken', ?, ?)''',
+                     [(f"2026-09-{day:02d} {hour:02d}:00:00", f"2026-09-{day:02d}")
+                      for day in range(1, 31) for hour in range(24)])
+    conn.commit()
+    conn.close()
+    pool = app.ConnectionPool(path)
+    yield pool
+    pool.close_all()
+
+
+def test_count_medication_history_matches_streamed_rows(pool):
+    with app.using_connection_pool(pool):
+        assert app.count_medication_history('alice', '2026-09-01', '2026-09-30') == 30 * 24
+        assert app.count_medication_history('alice', '2026-09-10', '2026-09-10') == \
+            sum(1 for _ in app.iter_medication_history('alice', '2026-09-10', '2026-09-10')) == 24
+
+
+def test_pdf_progress_covers_the_streamed_history(pool):
+    seen = []
+    pdf = app.generate_user_pdf_report('alice', '2026-09-01', '2026-09-30', progress=seen.append,
+                                       template=app.ReportTemplate(), pool=pool)
+
+    assert pdf.startswith(b'%PDF')
+    assert seen == sorted(seen)
+    # Without the history rows in the estimate, progress sat at 100% for most of the history table
+    assert seen.count(1.0) <= 1
+    assert seen[-1] > 0.9
+
+
+def test_unknown_user_raises_lookup_error(pool):
+    with pytest.raises(LookupError):
+        app.generate_user_pdf_report('nobody', '2026-09-01', '2026-09-30', pool=pool)